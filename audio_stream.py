@@ -0,0 +1,160 @@
+"""Проксирование аудио с серверов Яндекса по прямой ссылке без промежуточных файлов.
+
+Байты отдаются клиенту по мере получения от Яндекса, заголовок `Range` пробрасывается наверх,
+поэтому AVPlayer получает 206 и может перематывать, не скачивая весь файл.
+
+ETag у потока свой (`audio_etag`), а не ETag серверов Яндекса: тот же трек потом отдаётся из кэша
+через FileResponse, и `If-Range` с ETag, полученным при первом воспроизведении, должен совпасть.
+"""
+import hashlib
+import time
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiofiles
+import aiohttp
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from yandex_music import ClientAsync, DownloadInfo
+
+CHUNK_SIZE = 64 * 1024
+
+# Прямая ссылка живёт недолго, но перемотка шлёт новый Range-запрос каждые несколько секунд —
+# не резолвим ссылку заново на каждый из них
+DIRECT_LINK_TTL = 30
+
+# Соединений к серверам с аудио: каждое занято на всё воспроизведение, поэтому пул отдельный от API
+DEFAULT_STORAGE_POOL_SIZE = 256
+
+CODEC_MEDIA_TYPES = {'mp3': 'audio/mpeg', 'aac': 'audio/aac', 'he-aac': 'audio/aac'}
+
+_PASSTHROUGH_RESPONSE_HEADERS = ('content-length', 'content-range', 'accept-ranges')
+
+
+def audio_etag(cache_key: str) -> str:
+    """ETag варианта трека (трек + кодек + битрейт): одинаковый у потока с Яндекса и у файла из кэша."""
+    return f'"{hashlib.sha1(cache_key.encode()).hexdigest()}"'
+
+
+def pick_download_info(infos, codec: str, bitrate_in_kbps: Optional[int]) -> Optional[DownloadInfo]:
+    """Вариант загрузки с нужным кодеком; без битрейта — с максимальным битрейтом для кодека."""
+    candidates = [info for info in infos if info.codec == codec]
+    if bitrate_in_kbps is not None:
+        candidates = [info for info in candidates if info.bitrate_in_kbps == bitrate_in_kbps]
+    return max(candidates, key=lambda info: info.bitrate_in_kbps, default=None)
+
+
+def replace_origin(url: str, origin: str) -> str:
+    """Подменяет схему и хост ссылки: 'https://host/path' + 'http://127.0.0.1:9100' -> 'http://127.0.0.1:9100/path'."""
+    parts, target = urlsplit(url), urlsplit(origin)
+    return parts._replace(scheme=target.scheme, netloc=target.netloc).geturl()
+
+
+class StorageSession:
+    """Своя `aiohttp.ClientSession` для скачивания аудио с серверов хранилища.
+
+    Проксируемый поток держит соединение, пока плеер читает файл. В общей сессии API такие
+    соединения за пару десятков слушателей заняли бы весь пул, и встали бы все вызовы API.
+    Сессия создаётся в lifespan приложения (или лениво при первом обращении) и там же закрывается.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_STORAGE_POOL_SIZE) -> None:
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def open(self) -> aiohttp.ClientSession:
+        # Сессию можно создать только внутри работающего event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self._session
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self.open()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class DirectLinkResolver:
+    """Получает прямую ссылку на файл трека и кэширует её на `ttl` секунд.
+
+    Библиотека всегда собирает ссылку как https://<host из XML>/...; `storage_url` подменяет схему
+    и хост, чтобы аудио отдавал локальный стенд вместо серверов Яндекса.
+    """
+
+    def __init__(self, ttl: float = DIRECT_LINK_TTL, storage_url: Optional[str] = None) -> None:
+        self.ttl = ttl
+        self.storage_url = storage_url
+        self._links: Dict[Tuple[int, str, Optional[int]], Tuple[float, str]] = {}
+
+    async def resolve(self, client: ClientAsync, track_id: int, codec: str,
+                      bitrate_in_kbps: Optional[int]) -> str:
+        key = (track_id, codec, bitrate_in_kbps)
+        cached = self._links.get(key)
+        now = time.monotonic()
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        # Без get_direct_links: иначе библиотека запросит XML с прямой ссылкой для каждого варианта,
+        # а нужен только выбранный
+        infos = await client.tracks_download_info(track_id)
+        info = pick_download_info(infos, codec, bitrate_in_kbps)
+        if info is None:
+            variant = codec if bitrate_in_kbps is None else f"{codec} {bitrate_in_kbps} kbps"
+            raise HTTPException(status_code=404, detail=f"Недоступный вариант загрузки: {variant}")
+
+        direct_link = await info.get_direct_link_async()
+        if self.storage_url:
+            direct_link = replace_origin(direct_link, self.storage_url)
+        self._links = {k: v for k, v in self._links.items() if v[0] > now}
+        self._links[key] = (now + self.ttl, direct_link)
+        return direct_link
+
+
+async def proxy_audio(session: aiohttp.ClientSession, url: str, request_headers: Mapping[str, str],
+                      media_type: str, read_timeout: float, etag: str) -> StreamingResponse:
+    """Открывает файл по прямой ссылке и отдаёт его кусками, сохраняя статус 200/206/416 и Range-заголовки.
+
+    `If-Range` сверяется с нашим `etag`, а не уходит наверх: не совпал (или это дата) — отдаём файл целиком.
+    """
+    headers = {}
+    if_range = request_headers.get('if-range')
+    if 'range' in request_headers and (if_range is None or if_range == etag):
+        headers['range'] = request_headers['range']
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=read_timeout, sock_read=read_timeout)
+
+    try:
+        upstream = await session.get(url, headers=headers, timeout=timeout)
+    except aiohttp.ClientError as e:
+        raise HTTPException(status_code=502, detail=f"Не удалось получить аудио: {e}")
+
+    if upstream.status >= 400 and upstream.status != 416:
+        upstream.release()
+        raise HTTPException(status_code=502, detail=f"Сервер Яндекса вернул {upstream.status}")
+
+    response_headers = {name: upstream.headers[name] for name in _PASSTHROUGH_RESPONSE_HEADERS
+                        if name in upstream.headers}
+    response_headers.setdefault('accept-ranges', 'bytes')
+    response_headers['etag'] = etag
+
+    async def body():
+        try:
+            async for chunk in upstream.content.iter_chunked(CHUNK_SIZE):
+                yield chunk
+        finally:
+            upstream.release()
+
+    return StreamingResponse(body(), status_code=upstream.status, headers=response_headers, media_type=media_type)
+
+
+async def download_to_file(session: aiohttp.ClientSession, url: str, path: str, read_timeout: float) -> None:
+    """Скачивает файл по прямой ссылке на диск кусками, не держа его целиком в памяти."""
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=read_timeout, sock_read=read_timeout)
+    async with session.get(url, timeout=timeout) as upstream:
+        upstream.raise_for_status()
+        async with aiofiles.open(path, 'wb') as f:
+            async for chunk in upstream.content.iter_chunked(CHUNK_SIZE):
+                await f.write(chunk)
@@ -0,0 +1,146 @@
+"""Проверка API-ключа и ограничения на ключ: частота запросов (token bucket) и число одновременных запросов.
+
+Сделано чистым ASGI-middleware, а не через `@app.middleware("http")`: BaseHTTPMiddleware гоняет
+каждый ответ через промежуточный поток и буферизует стриминговые ответы, а HTTPException,
+брошенный внутри него, превращается в 500. Здесь отказ — обычный JSON-ответ 403/429, а
+разрешённый запрос уходит в приложение без обёрток.
+"""
+import hmac
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+
+from metrics import REJECTED_REQUESTS
+
+DEFAULT_RATE = 100.0
+DEFAULT_BURST = 200
+DEFAULT_MAX_CONCURRENT = 64
+DEFAULT_EXEMPT_PATHS = ('/docs', '/openapi.json')
+
+
+def parse_keys(*values: Optional[str]) -> List[str]:
+    """Ключи из переменных окружения: в каждой — один ключ или несколько через запятую."""
+    keys = [key.strip() for value in values if value for key in value.split(',')]
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def match_key(candidate: str, keys: Sequence[str]) -> Optional[str]:
+    """Ищет ключ сравнением за постоянное время; сравниваются все ключи, чтобы время не зависело от позиции."""
+    candidate_bytes = candidate.encode()
+    matched = None
+    for key in keys:
+        if hmac.compare_digest(candidate_bytes, key.encode()):
+            matched = key
+    return matched
+
+
+class TokenBucket:
+    """`rate` запросов в секунду в среднем и всплески до `burst` запросов."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """0, если токен выдан, иначе через сколько секунд он появится."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ApiKeyMiddleware:
+    """Пропускает запросы с известным ключом (заголовок X-API-KEY или параметр apiKey).
+
+    `rate`/`burst` и `max_concurrent` считаются для каждого ключа отдельно; 0 отключает ограничение.
+    `max_concurrent` ограничивает запросы, для которых ещё не начат ответ, а не длительность передачи.
+    Без настроенных ключей проверка выключена.
+    """
+
+    def __init__(self, app: Any, keys: Iterable[str], rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+                 exempt_paths: Sequence[str] = DEFAULT_EXEMPT_PATHS) -> None:
+        self.app = app
+        self.keys = list(keys)
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_concurrent = max_concurrent
+        self.exempt_paths = tuple(exempt_paths)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._in_flight: Dict[str, int] = {}
+        if not self.keys:
+            print("API-ключи не заданы (API_KEY/API_KEYS): проверка ключа и ограничения отключены.")
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope['type'] != 'http' or not self.keys or scope['path'].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        key = match_key(self._request_key(scope) or '', self.keys)
+        if key is None:
+            await self._reject(scope, receive, send, 403, 'invalid_key', "Forbidden: Invalid API Key")
+            return
+
+        rejection = self._check_limits(key)
+        if rejection is not None:
+            reason, retry_after = rejection
+            await self._reject(scope, receive, send, 429, reason, "Too Many Requests",
+                               {'Retry-After': str(max(1, math.ceil(retry_after)))})
+            return
+
+        # Слот занят, пока запрос обрабатывается, и освобождается с началом ответа: иначе поток
+        # /stream или /download держал бы его всё время передачи файла
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._in_flight[key] -= 1
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message['type'] == 'http.response.start':
+                release()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
+
+    @staticmethod
+    def _request_key(scope: Dict[str, Any]) -> Optional[str]:
+        key = Headers(scope=scope).get('x-api-key')
+        if key is None:
+            values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('apiKey')
+            key = values[0] if values else None
+        return key
+
+    def _check_limits(self, key: str) -> Optional[Tuple[str, float]]:
+        if self.max_concurrent and self._in_flight.get(key, 0) >= self.max_concurrent:
+            return 'concurrency', 1.0
+        if self.rate:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            retry_after = bucket.take()
+            if retry_after:
+                return 'rate', retry_after
+        return None
+
+    @staticmethod
+    async def _reject(scope: Dict[str, Any], receive: Any, send: Any, status: int, reason: str, detail: str,
+                      headers: Optional[Dict[str, str]] = None) -> None:
+        REJECTED_REQUESTS.inc((reason,))
+        response = JSONResponse({"detail": detail}, status_code=status, headers=headers)
+        await response(scope, receive, send)
@@ -0,0 +1,70 @@
+"""Сравнение задержки запроса: новый клиент на каждый запрос против общего клиента с пулом соединений.
+
+Запуск:
+    YANDEX_TOKEN=... python benchmarks/client_lifecycle.py --track-id 33311009 --iterations 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from yandex_music import ClientAsync
+
+from yandex_client import ClientManager
+
+
+async def measure(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<28} mean={statistics.mean(timings):8.1f} ms  p50={statistics.median(timings):8.1f} ms  "
+          f"p95={p95:8.1f} ms")
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--track-id", default="33311009")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--base-url", default=os.getenv("YANDEX_BASE_URL"))
+    args = parser.parse_args()
+
+    token = os.getenv("YANDEX_TOKEN")
+
+    async def per_request_client():
+        client = await ClientAsync(token, base_url=args.base_url).init()
+        await client.tracks([args.track_id])
+
+    manager = ClientManager(token, base_url=args.base_url)
+    started = time.perf_counter()
+    await manager.get()
+    print(f"Инициализация общего клиента: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    async def shared_client():
+        client = await manager.get()
+        await client.tracks([args.track_id])
+
+    cold = await measure(per_request_client, args.iterations)
+    warm = await measure(shared_client, args.iterations)
+    await manager.close()
+
+    report("get_client() на запрос", cold)
+    report("общий ClientManager", warm)
+    print(f"Экономия на запрос: {statistics.mean(cold) - statistics.mean(warm):.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,290 @@
+"""Локальный стенд вместо api.music.yandex.net и серверов с аудио.
+
+Отдаёт ответы из JSON-фикстур (`benchmarks/fixtures`, формат как у настоящего API) и аудиобайты
+с поддержкой Range. Задержку и ошибки можно задать переменными окружения при старте или поменять
+на лету через `POST /_fake/config`; счётчики вызовов по маршрутам — `GET /_fake/calls`.
+
+Запуск и подключение сервиса:
+    python benchmarks/fake_upstream.py --port 9100
+    YANDEX_TOKEN=fake YANDEX_BASE_URL=http://127.0.0.1:9100 YANDEX_STORAGE_URL=http://127.0.0.1:9100 \\
+        YANDEX_AVATARS_URL=http://127.0.0.1:9100 uvicorn main:app
+
+Настройки (переменная окружения / ключ в /_fake/config):
+    FAKE_LATENCY_MS / latency_ms       задержка каждого ответа API (по умолчанию 50)
+    FAKE_JITTER_MS / jitter_ms         случайная добавка к задержке, 0..jitter (по умолчанию 0)
+    FAKE_ERROR_RATE / error_rate       доля ответов с ошибкой, 0..1 (по умолчанию 0)
+    FAKE_ERROR_STATUS / error_status   HTTP-статус ошибки (по умолчанию 500)
+    FAKE_HANG_RATE / hang_rate         доля запросов, которые «зависают» на hang_seconds
+    FAKE_HANG_SECONDS / hang_seconds   сколько висит такой запрос (по умолчанию 30)
+    FAKE_FAULT_PATHS / fault_paths     префиксы путей, к которым применяются ошибки и зависания
+                                       (через запятую в env, список в JSON; пусто — ко всем)
+    FAKE_AUDIO_BYTES / —               размер аудиофайла трека (по умолчанию 4 МиБ)
+"""
+import argparse
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+FIXTURES_DIR = os.getenv("FAKE_FIXTURES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+
+MIXES_COUNT = 6
+MIX_TRACKS = 60
+CHART_TRACKS = 100
+ALBUM_TRACKS = 12
+COVER_BYTES = 20 * 1024
+SUGGEST_LIMIT = 10
+# Словарь подсказок: «трек 1» … «трек 999» и пара исполнителей, чтобы были и короткие, и длинные списки
+SUGGEST_WORDS = [f"трек {i}" for i in range(1, 1000)] + ["the beatles", "beastie boys", "bee gees"]
+
+config: Dict[str, Any] = {
+    "latency_ms": float(os.getenv("FAKE_LATENCY_MS", "50")),
+    "jitter_ms": float(os.getenv("FAKE_JITTER_MS", "0")),
+    "error_rate": float(os.getenv("FAKE_ERROR_RATE", "0")),
+    "error_status": int(os.getenv("FAKE_ERROR_STATUS", "500")),
+    "hang_rate": float(os.getenv("FAKE_HANG_RATE", "0")),
+    "hang_seconds": float(os.getenv("FAKE_HANG_SECONDS", "30")),
+    "fault_paths": [path for path in os.getenv("FAKE_FAULT_PATHS", "").split(",") if path],
+}
+calls: Counter = Counter()
+
+
+def load_fixture(name: str) -> Any:
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+FIXTURES = {name: load_fixture(name) for name in ("account_status", "track", "playlist", "album", "download_info")}
+
+# Детерминированные байты «аудио»: одинаковые между запусками, чтобы ETag и кэш на диске совпадали
+AUDIO = hashlib.shake_256(b"fake-audio").digest(int(os.getenv("FAKE_AUDIO_BYTES", 4 * 1024 * 1024)))
+AUDIO_ETAG = f'"{hashlib.sha1(AUDIO).hexdigest()}"'
+
+
+def track(track_id: int) -> Dict[str, Any]:
+    data = copy.deepcopy(FIXTURES["track"])
+    data.update(id=str(track_id), realId=str(track_id), title=f"Трек {track_id}")
+    album = data["albums"][0]
+    album.update(id=track_id // 10 + 1, title=f"Альбом {track_id // 10 + 1}", bests=[track_id])
+    data["coverUri"] = f"avatars.yandex.net/get-music-content/{track_id // 10 + 1}/a.{track_id}/%%"
+    return data
+
+
+def playlist(kind: int, with_tracks: bool = True) -> Dict[str, Any]:
+    data = copy.deepcopy(FIXTURES["playlist"])
+    first = kind * 1000
+    data.update(kind=kind, title=f"Микс {kind}", trackCount=MIX_TRACKS)
+    if with_tracks:
+        data["tracks"] = [{"id": track_id, "track": track(track_id), "timestamp": "2024-05-20T00:00:00+03:00"}
+                          for track_id in range(first, first + MIX_TRACKS)]
+    data["cover"]["uri"] = data["cover"]["uri"].replace("playlist.0", f"playlist.{kind}")
+    return data
+
+
+def album(album_id: int) -> Dict[str, Any]:
+    data = copy.deepcopy(FIXTURES["album"])
+    first = (album_id - 1) * 10
+    data.update(id=album_id, title=f"Альбом {album_id}", trackCount=ALBUM_TRACKS,
+                volumes=[[track(track_id) for track_id in range(first, first + ALBUM_TRACKS)]],
+                coverUri=f"avatars.yandex.net/get-music-content/{album_id}/a.{album_id}/%%")
+    return data
+
+
+def ok(result: Any) -> JSONResponse:
+    return JSONResponse({"invocationInfo": {"hostname": "fake", "req-id": "fake", "exec-duration-millis": 0},
+                         "result": result})
+
+
+async def simulate(name: str, request: Request) -> Optional[Response]:
+    """Учитывает вызов, выдерживает задержку и, если выпало, возвращает ошибку или «зависает»."""
+    calls[name] += 1
+
+    delay = config["latency_ms"] + random.uniform(0, config["jitter_ms"])
+    await asyncio.sleep(delay / 1000)
+
+    paths: List[str] = config["fault_paths"]
+    if paths and not any(request.url.path.startswith(path) for path in paths):
+        return None
+    if random.random() < config["hang_rate"]:
+        await asyncio.sleep(config["hang_seconds"])
+    if random.random() < config["error_rate"]:
+        return JSONResponse({"error": {"name": "fake-error", "message": "injected"}}, status_code=config["error_status"])
+    return None
+
+
+def faulty(handler):
+    async def endpoint(request: Request) -> Response:
+        try:
+            return await simulate(handler.__name__, request) or await handler(request)
+        except ClientDisconnect:
+            # Клиент отменил запрос (таймаут, хеджирование) — для стенда это не ошибка
+            return Response(status_code=499)
+    return endpoint
+
+
+async def account_status(request: Request) -> Response:
+    return ok(FIXTURES["account_status"])
+
+
+async def tracks(request: Request) -> Response:
+    form = parse_qs((await request.body()).decode())
+    track_ids = ",".join(form.get("track-ids", [])).split(",")
+    return ok([track(int(track_id.split(":")[0])) for track_id in track_ids if track_id])
+
+
+async def landing(request: Request) -> Response:
+    blocks = ",".join(request.query_params.getlist("blocks")).split(",")
+    result = []
+    if "personal-playlists" in blocks:
+        result.append({"id": "personal-playlists", "type": "personal-playlists", "typeForFrom": "personal-playlists",
+                       "title": "Собрано для вас", "entities": [
+                           {"id": f"mix-{kind}", "type": "personal-playlist",
+                            "data": {"type": "playlistOfTheDay", "ready": True, "notify": False,
+                                     "data": playlist(kind, with_tracks=False)}}
+                           for kind in range(1, MIXES_COUNT + 1)]})
+    if "chart" in blocks:
+        result.append({"id": "chart", "type": "chart", "typeForFrom": "chart", "title": "Чарт", "entities": [
+            {"id": f"chart-{position}", "type": "chart-item",
+             "data": {"track": track(position), "chart": {"position": position, "progress": "same",
+                                                          "listeners": 1000 - position, "shift": 0}}}
+            for position in range(1, CHART_TRACKS + 1)]})
+    return ok({"pumpkin": False, "contentId": "fake", "blocks": result})
+
+
+async def users_playlist(request: Request) -> Response:
+    return ok(playlist(int(request.path_params["kind"])))
+
+
+async def album_with_tracks(request: Request) -> Response:
+    return ok(album(int(request.path_params["album_id"])))
+
+
+async def albums(request: Request) -> Response:
+    form = parse_qs((await request.body()).decode())
+    album_ids = ",".join(form.get("album-ids", [])).split(",")
+    return ok([album(int(album_id)) for album_id in album_ids if album_id])
+
+
+async def search(request: Request) -> Response:
+    text = request.query_params.get("text", "")
+    page = int(request.query_params.get("page", 0))
+    search_type = request.query_params.get("type", "all")
+    found = [track(page * 10 + i) for i in range(10)]
+    result = {
+        "searchRequestId": "fake", "text": text, "page": page, "misspellCorrected": False, "nocorrect": False,
+        "best": {"type": "track", "result": found[0]},
+        "tracks": {"total": 100, "perPage": 10, "order": 0, "results": found},
+        "albums": {"total": 10, "perPage": 10, "order": 1, "results": [album(page * 3 + i + 1) for i in range(3)]},
+    }
+    if search_type != "all":
+        # Поиск по одному типу: без лучшего результата и других разделов, как у настоящего API
+        result = {key: value for key, value in result.items() if key not in ("best", "tracks", "albums")
+                  or key == f"{search_type}s"}
+    return ok(result)
+
+
+async def search_suggest(request: Request) -> Response:
+    part = request.query_params.get("part", "").lower()
+    found = [word for word in SUGGEST_WORDS if word.startswith(part) or f" {part}" in word][:SUGGEST_LIMIT]
+    best = {"type": "track", "text": found[0], "result": track(len(found[0]))} if found else None
+    return ok({"best": best, "suggestions": found})
+
+
+async def download_info(request: Request) -> Response:
+    track_id = request.path_params["track_id"]
+    base = f"{request.url.scheme}://{request.url.netloc}"
+    return ok([{**info, "downloadInfoUrl": f"{base}/download-xml/{track_id}/{info['codec']}/{info['bitrateInKbps']}"}
+               for info in FIXTURES["download_info"]])
+
+
+async def download_xml(request: Request) -> Response:
+    track_id = request.path_params["track_id"]
+    xml = (f"<?xml version=\"1.0\" encoding=\"utf-8\"?><download-info><host>{request.url.netloc}</host>"
+           f"<path>/audio/{track_id}.mp3</path><ts>0005c5f6</ts><region>-1</region><s>fake</s></download-info>")
+    return Response(xml, media_type="text/xml")
+
+
+async def avatar(request: Request) -> Response:
+    """Обложка, как у avatars.yandex.net: свои байты на каждый путь (шаблон + размер)."""
+    body = b"\xff\xd8\xff\xe0" + hashlib.shake_256(request.url.path.encode()).digest(COVER_BYTES)
+    return Response(body, media_type="image/jpeg")
+
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+async def audio(request: Request) -> Response:
+    """Файл трека с поддержкой одного диапазона Range, как у storage.yandex.net."""
+    size = len(AUDIO)
+    headers = {"Accept-Ranges": "bytes", "ETag": AUDIO_ETAG}
+    match = _RANGE_RE.match(request.headers.get("range", ""))
+    if_range = request.headers.get("if-range")
+    if not match or (if_range and if_range != AUDIO_ETAG):
+        return Response(AUDIO, media_type="audio/mpeg", headers=headers)
+
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last) if last else size - 1, size - 1)
+    else:
+        start, end = max(size - int(last or 0), 0), size - 1
+    if start >= size or start > end:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(AUDIO[start:end + 1], status_code=206, media_type="audio/mpeg", headers=headers)
+
+
+async def get_config(request: Request) -> Response:
+    if request.method == "POST":
+        config.update(await request.json())
+    return JSONResponse(config)
+
+
+async def get_calls(request: Request) -> Response:
+    if request.method == "DELETE":
+        calls.clear()
+    return JSONResponse(dict(calls))
+
+
+routes = [
+    Route("/account/status", faulty(account_status)),
+    Route("/tracks", faulty(tracks), methods=["POST"]),
+    Route("/landing3", faulty(landing)),
+    Route("/users/{user_id}/playlists/{kind:int}", faulty(users_playlist)),
+    Route("/albums", faulty(albums), methods=["POST"]),
+    Route("/albums/{album_id:int}/with-tracks", faulty(album_with_tracks)),
+    Route("/search", faulty(search)),
+    Route("/search/suggest", faulty(search_suggest)),
+    Route("/tracks/{track_id}/download-info", faulty(download_info)),
+    Route("/download-xml/{track_id}/{codec}/{bitrate}", faulty(download_xml)),
+    Route("/get-mp3/{sign}/{ts}/audio/{name}", faulty(audio)),
+    Route("/get-music-content/{path:path}", faulty(avatar)),
+    Route("/get-music-user-playlist/{path:path}", faulty(avatar)),
+    Route("/_fake/config", get_config, methods=["GET", "POST"]),
+    Route("/_fake/calls", get_calls, methods=["GET", "DELETE"]),
+]
+app = Starlette(routes=routes)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
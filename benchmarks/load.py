@@ -0,0 +1,236 @@
+"""Нагрузочный прогон всех эндпоинтов против локального стенда Яндекса (benchmarks/fake_upstream.py).
+
+Поднимает стенд и сервис (uvicorn и/или gunicorn с UvicornWorker), для каждого маршрута и уровня
+параллельности гоняет запросы `--duration` секунд и печатает пропускную способность и p50/p95/p99.
+Результаты пишутся в JSON (`--output`); с `--baseline` прогон сравнивается с сохранённым и
+завершается с кодом 1, если p95 вырос или RPS упал больше чем на `--max-regression`.
+
+Запуск:
+    python benchmarks/load.py --servers uvicorn,gunicorn --concurrency 1,16,64 --duration 10 \\
+        --output bench.json
+    python benchmarks/load.py --baseline bench.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_KEY = "bench"
+
+# {i_mod_N} — номер запроса по модулю N: id перебираются, чтобы в прогоне были и попадания в кэш, и промахи
+ROUTES = {
+    "search": ("/search?query=bench{i_mod_50}", {}),
+    "track": ("/track/{i_mod_500}", {}),
+    "tracks": ("/tracks?ids=" + ",".join(str(track_id) for track_id in range(1, 51)), {}),
+    "album": ("/album/{i_mod_50}", {}),
+    "mixes": ("/mixes", {}),
+    "mixes_stream": ("/mixes/stream", {}),
+    "chart": ("/chart", {}),
+    "stream_range": ("/stream/{i_mod_20}", {"Range": "bytes=0-65535"}),
+    "download": ("/download/{i_mod_20}", {}),
+    "cover": ("/cover/track/{i_mod_500}", {}),
+}
+
+SERVER_COMMANDS = {
+    "uvicorn": lambda port, workers: [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                      "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+    "gunicorn": lambda port, workers: [sys.executable, "-m", "gunicorn", "main:app", "-k", "uvicorn.workers.UvicornWorker",
+                                       "-w", str(workers), "-b", f"127.0.0.1:{port}", "--log-level", "warning"],
+}
+
+TRACKED_METRICS = ("p95_ms", "rps")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+async def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} не поднялся за {timeout} с")
+
+
+def start_process(command: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(command, cwd=ROOT, env={**os.environ, **env})
+
+
+def stop_process(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def run_route(session: aiohttp.ClientSession, base_url: str, path: str, headers: Dict[str, str],
+                    concurrency: int, duration: float) -> Dict[str, float]:
+    """`concurrency` клиентов шлют запросы подряд `duration` секунд; задержки считаются до конца тела."""
+    latencies: List[float] = []
+    errors = 0
+    counter = 0
+    deadline = time.monotonic() + duration
+
+    async def worker() -> None:
+        nonlocal errors, counter
+        while time.monotonic() < deadline:
+            i = counter
+            counter += 1
+            url = base_url + path.format(i_mod_20=i % 20, i_mod_50=i % 50 + 1, i_mod_500=i % 500 + 1)
+            started = time.perf_counter()
+            try:
+                async with session.get(url, headers=headers) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+                        continue
+            except aiohttp.ClientError:
+                errors += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+async def bench_server(base_url: str, routes: List[str], levels: List[int], duration: float) -> Dict[str, Dict]:
+    results = {}
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, headers={"X-API-KEY": API_KEY}) as session:
+        for route in routes:
+            path, headers = ROUTES[route]
+            # Прогрев: первый запрос собирает кэши и снапшоты, его в замер не берём
+            async with session.get(base_url + path.format(i_mod_20=0, i_mod_50=1, i_mod_500=1),
+                                   headers=headers) as response:
+                await response.read()
+            for concurrency in levels:
+                stats = await run_route(session, base_url, path, headers, concurrency, duration)
+                results[f"{route}/c{concurrency}"] = stats
+                print(f"  {route:<14} c={concurrency:<4} {stats['rps']:9.1f} rps  p50={stats['p50_ms']:8.1f} ms  "
+                      f"p95={stats['p95_ms']:8.1f} ms  p99={stats['p99_ms']:8.1f} ms  errors={stats['errors']}")
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float) -> List[str]:
+    """Список регрессий: p95 выше базового или RPS ниже базового больше чем на `max_regression`."""
+    regressions = []
+    for key, base in baseline.items():
+        current = results.get(key)
+        if current is None:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{key}: p95 {base['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if base["rps"] and current["rps"] < base["rps"] * (1 - max_regression):
+            regressions.append(f"{key}: rps {base['rps']:.1f} -> {current['rps']:.1f}")
+    return regressions
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", default="uvicorn,gunicorn")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--routes", default=",".join(ROUTES))
+    parser.add_argument("--concurrency", default="1,16,64", help="уровни параллельности через запятую")
+    parser.add_argument("--duration", type=float, default=10, help="секунд на каждый маршрут и уровень")
+    parser.add_argument("--latency-ms", type=float, default=50, help="задержка стенда Яндекса")
+    parser.add_argument("--upstream", help="URL уже запущенного стенда (иначе поднимается свой)")
+    parser.add_argument("--output", help="куда сохранить результаты (JSON)")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    routes = args.routes.split(",")
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    upstream: Optional[subprocess.Popen] = None
+    upstream_url = args.upstream
+    if upstream_url is None:
+        port = free_port()
+        upstream_url = f"http://127.0.0.1:{port}"
+        upstream = start_process([sys.executable, "benchmarks/fake_upstream.py", "--port", str(port)],
+                                 {"FAKE_LATENCY_MS": str(args.latency_ms)})
+    results: Dict[str, Dict] = {}
+    try:
+        await wait_ready(f"{upstream_url}/_fake/calls")
+        for server in args.servers.split(","):
+            port = free_port()
+            with tempfile.TemporaryDirectory() as audio_cache_dir:
+                process = start_process(SERVER_COMMANDS[server](port, args.workers), {
+                    "YANDEX_TOKEN": "fake",
+                    "YANDEX_BASE_URL": upstream_url,
+                    "YANDEX_STORAGE_URL": upstream_url,
+                    "YANDEX_AVATARS_URL": upstream_url,
+                    "API_KEY": API_KEY,
+                    # Меряем сам сервис, а не лимиты на ключ
+                    "RATE_LIMIT_PER_KEY": "0",
+                    "MAX_CONCURRENT_PER_KEY": "0",
+                    "AUDIO_CACHE_DIR": audio_cache_dir,
+                    "COVER_CACHE_DIR": os.path.join(audio_cache_dir, "covers"),
+                })
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    await wait_ready(f"{base_url}/openapi.json")
+                    print(f"{server} (workers={args.workers}):")
+                    for key, stats in (await bench_server(base_url, routes, levels, args.duration)).items():
+                        results[f"{server}/{key}"] = stats
+                finally:
+                    stop_process(process)
+    finally:
+        if upstream is not None:
+            stop_process(upstream)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"Регрессии больше {args.max_regression:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"Регрессий больше {args.max_regression:.0%} нет ({', '.join(TRACKED_METRICS)}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,210 @@
+"""Сценарии сбоев Яндекса против стенда с внедрением ошибок: повторы, circuit breaker, хеджирование, лимиты.
+
+Каждый сценарий поднимает свой стенд (`fake_upstream.py`) и свой uvicorn с нужными настройками защиты,
+ломает стенд через `POST /_fake/config` и проверяет поведение сервиса. Код выхода 1, если хоть одна
+проверка не прошла.
+
+Запуск:
+    python benchmarks/resilience_scenarios.py
+    python benchmarks/resilience_scenarios.py --scenarios breaker,hedging
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import aiohttp
+
+from load import API_KEY, SERVER_COMMANDS, free_port, percentile, start_process, stop_process, wait_ready
+
+Result = Tuple[int, float, Dict[str, str]]
+
+
+class Stand:
+    """Запущенные стенд Яндекса и сервис; `get` возвращает (статус, секунды, заголовки)."""
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str, upstream_url: str) -> None:
+        self.session = session
+        self.base_url = base_url
+        self.upstream_url = upstream_url
+
+    async def get(self, path: str) -> Result:
+        started = time.perf_counter()
+        async with self.session.get(self.base_url + path) as response:
+            await response.read()
+            return response.status, time.perf_counter() - started, dict(response.headers)
+
+    async def get_many(self, paths: List[str], concurrency: int) -> List[Result]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(path: str) -> Result:
+            async with semaphore:
+                return await self.get(path)
+
+        return await asyncio.gather(*(fetch(path) for path in paths))
+
+    async def configure(self, **options: Any) -> None:
+        async with self.session.post(f"{self.upstream_url}/_fake/config", json=options) as response:
+            response.raise_for_status()
+
+    async def calls(self, reset: bool = False) -> Dict[str, int]:
+        async with self.session.get(f"{self.upstream_url}/_fake/calls") as response:
+            calls = await response.json()
+        if reset:
+            async with self.session.delete(f"{self.upstream_url}/_fake/calls"):
+                pass
+        return calls
+
+
+@asynccontextmanager
+async def stand(env: Dict[str, str], latency_ms: float = 20) -> AsyncIterator[Stand]:
+    upstream_port, port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    upstream = start_process([sys.executable, "benchmarks/fake_upstream.py", "--port", str(upstream_port)],
+                             {"FAKE_LATENCY_MS": str(latency_ms)})
+    try:
+        await wait_ready(f"{upstream_url}/_fake/calls")
+        with tempfile.TemporaryDirectory() as audio_cache_dir:
+            server = start_process(SERVER_COMMANDS["uvicorn"](port, 1), {
+                "YANDEX_TOKEN": "fake",
+                "YANDEX_BASE_URL": upstream_url,
+                "YANDEX_STORAGE_URL": upstream_url,
+                "YANDEX_AVATARS_URL": upstream_url,
+                "API_KEY": API_KEY,
+                "RATE_LIMIT_PER_KEY": "0",
+                "MAX_CONCURRENT_PER_KEY": "0",
+                "AUDIO_CACHE_DIR": audio_cache_dir,
+                "COVER_CACHE_DIR": os.path.join(audio_cache_dir, "covers"),
+                **env,
+            })
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                await wait_ready(f"{base_url}/openapi.json")
+                connector = aiohttp.TCPConnector(limit=0)
+                async with aiohttp.ClientSession(connector=connector, headers={"X-API-KEY": API_KEY}) as session:
+                    yield Stand(session, base_url, upstream_url)
+            finally:
+                stop_process(server)
+    finally:
+        stop_process(upstream)
+
+
+class Checks:
+    def __init__(self) -> None:
+        self.failed: List[str] = []
+
+    def expect(self, condition: bool, description: str) -> None:
+        print(f"    [{'ok' if condition else 'FAIL'}] {description}")
+        if not condition:
+            self.failed.append(description)
+
+
+def error_share(results: List[Result]) -> float:
+    return sum(status >= 500 for status, _, _ in results) / len(results)
+
+
+async def scenario_retries(checks: Checks) -> None:
+    """30% ответов поиска — 500: без повторов ошибки видят клиенты, с повторами почти нет."""
+    paths = [f"/search?query=retry{i}" for i in range(100)]
+    shares = {}
+    for retries in ("0", "3"):
+        async with stand({"UPSTREAM_RETRIES": retries, "CIRCUIT_FAILURE_THRESHOLD": "1000"}) as s:
+            await s.configure(error_rate=0.3, fault_paths=["/search"])
+            shares[retries] = error_share(await s.get_many(paths, concurrency=8))
+            print(f"    UPSTREAM_RETRIES={retries}: {shares[retries]:.0%} ответов 5xx")
+    checks.expect(shares["0"] > 0.15, "без повторов сбои доходят до клиентов")
+    checks.expect(shares["3"] <= 0.03, "с повторами доля 5xx не больше 3%")
+
+
+async def scenario_breaker(checks: Checks) -> None:
+    """Альбомы лежат: breaker открывается, вызовы падают сразу, кэш отдаётся, после reset_timeout — закрывается."""
+    async with stand({"CIRCUIT_FAILURE_THRESHOLD": "3", "CIRCUIT_RESET_TIMEOUT": "2", "UPSTREAM_RETRIES": "1"}) as s:
+        status, _, _ = await s.get("/album/1")
+        checks.expect(status == 200, "альбом 1 загружен в кэш до сбоя")
+
+        await s.configure(error_rate=1.0, fault_paths=["/albums"])
+        await s.calls(reset=True)
+        results = [await s.get(f"/album/{album_id}") for album_id in range(2, 12)]
+        calls = (await s.calls()).get("album_with_tracks", 0)
+        checks.expect(all(status == 503 for status, _, _ in results), "пока Яндекс лежит, ответ 503, а не 500")
+        checks.expect(calls <= 4, f"после открытия breaker вызовы не уходят в Яндекс ({calls} вызовов на 10 запросов)")
+        fast = [seconds for _, seconds, _ in results[-5:]]
+        checks.expect(max(fast) < 0.05, f"открытый breaker отвечает сразу (до {max(fast) * 1000:.0f} мс)")
+        checks.expect(all("retry-after" in {k.lower() for k in headers} for _, _, headers in results[-5:]),
+                      "ответы открытого breaker содержат Retry-After")
+
+        status, _, _ = await s.get("/album/1?nocache=true")
+        checks.expect(status == 200, "закэшированный альбом отдаётся, несмотря на открытый breaker")
+
+        await s.configure(error_rate=0.0)
+        await asyncio.sleep(2.2)
+        status, _, _ = await s.get("/album/20")
+        checks.expect(status == 200, "после reset_timeout пробный вызов проходит и breaker закрывается")
+        status, _, _ = await s.get("/album/21")
+        checks.expect(status == 200, "после закрытия breaker запросы снова идут в Яндекс")
+
+
+async def scenario_hedging(checks: Checks) -> None:
+    """3% вызовов поиска висят секунду: хеджирование через 100 мс срезает хвост задержек."""
+    paths = [f"/search?query=hedge{i}" for i in range(400)]
+    p99 = {}
+    for hedge_ms in ("0", "100"):
+        async with stand({"UPSTREAM_HEDGE_DELAY_MS": hedge_ms}) as s:
+            await s.configure(hang_rate=0.03, hang_seconds=1.0, fault_paths=["/search"])
+            results = await s.get_many(paths, concurrency=8)
+            latencies = sorted(seconds * 1000 for _, seconds, _ in results)
+            p99[hedge_ms] = percentile(latencies, 0.99)
+            print(f"    UPSTREAM_HEDGE_DELAY_MS={hedge_ms}: p50={percentile(latencies, 0.5):.0f} мс "
+                  f"p99={p99[hedge_ms]:.0f} мс, 5xx {error_share(results):.0%}")
+    checks.expect(p99["100"] < p99["0"] / 2, "хеджирование как минимум вдвое уменьшает p99")
+
+
+async def scenario_bulkhead(checks: Checks) -> None:
+    """Яндекс отвечает секунду: лишние запросы быстро получают 503, а не копятся в очереди."""
+    env = {"UPSTREAM_MAX_CONCURRENCY": "4", "UPSTREAM_QUEUE_TIMEOUT": "0.2"}
+    async with stand(env, latency_ms=1000) as s:
+        # Дожидаемся фоновой сборки чарта, чтобы она не занимала слоты во время замера
+        await s.get("/chart")
+        await s.calls(reset=True)
+        results = await s.get_many([f"/search?query=busy{i}" for i in range(40)], concurrency=40)
+        calls = (await s.calls()).get("search", 0)
+        ok = [seconds for status, seconds, _ in results if status == 200]
+        busy = [seconds for status, seconds, _ in results if status == 503]
+        print(f"    200: {len(ok)}, 503: {len(busy)}, вызовов поиска в Яндекс: {calls}")
+        checks.expect(calls <= 4, "одновременно в Яндекс уходит не больше UPSTREAM_MAX_CONCURRENCY вызовов")
+        checks.expect(len(ok) >= 4, "запросы в пределах лимита выполняются")
+        checks.expect(bool(busy) and max(busy) < 0.6, "лишние запросы получают 503 через ~UPSTREAM_QUEUE_TIMEOUT")
+
+
+SCENARIOS = {
+    "retries": scenario_retries,
+    "breaker": scenario_breaker,
+    "hedging": scenario_hedging,
+    "bulkhead": scenario_bulkhead,
+}
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    args = parser.parse_args()
+
+    checks = Checks()
+    for name in args.scenarios.split(","):
+        scenario = SCENARIOS[name]
+        print(f"{name}: {scenario.__doc__}")
+        await scenario(checks)
+
+    if checks.failed:
+        print(f"Не прошло проверок: {len(checks.failed)}")
+        return 1
+    print("Все проверки прошли.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
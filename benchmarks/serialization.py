@@ -0,0 +1,88 @@
+"""Размер ответа и CPU на сериализацию: полный `to_dict()` против краткой схемы + orjson.
+
+Собирает ответ в форме `/mixes` (4 микса по `--tracks` треков) из JSON, похожего на ответ Яндекса,
+и сравнивает старый путь (to_dict -> jsonable_encoder -> json.dumps, как у FastAPI по умолчанию)
+с новым (track_summary -> orjson).
+
+Запуск:
+    python benchmarks/serialization.py --tracks 60 --iterations 20
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from yandex_music import Track
+
+from projections import dumps, track_summary
+
+
+def raw_track(track_id):
+    """Трек в том виде, в каком его отдаёт api.music.yandex.net (основные поля)."""
+    artist = {
+        "id": 41191, "name": "Исполнитель", "various": False, "composer": False, "genres": [],
+        "cover": {"type": "from-artist-photos", "uri": "avatars.yandex.net/get-music-content/113160/a.b/%%",
+                  "prefix": "a.b/"},
+        "disclaimers": [],
+    }
+    album = {
+        "id": 3000000 + track_id, "title": "Альбом", "type": "single", "metaType": "music", "year": 2023,
+        "releaseDate": "2023-06-02T00:00:00+03:00", "coverUri": "avatars.yandex.net/get-music-content/9/c.d/%%",
+        "ogImage": "avatars.yandex.net/get-music-content/9/c.d/%%", "genre": "rusrap", "trackCount": 1,
+        "likesCount": 12345, "recent": False, "veryImportant": False, "artists": [artist],
+        "labels": [{"id": 1, "name": "Лейбл"}], "available": True, "availableForPremiumUsers": True,
+        "availableForOptions": ["bookmate"], "availableForMobile": True, "availablePartially": False,
+        "bests": [track_id], "disclaimers": [], "listeningFinished": False,
+        "trackPosition": {"volume": 1, "index": 1},
+    }
+    return {
+        "id": str(track_id), "realId": str(track_id), "title": f"Трек {track_id}", "trackSource": "OWN",
+        "major": {"id": 1, "name": "IRICOM"}, "available": True, "availableForPremiumUsers": True,
+        "availableFullWithoutPermission": False, "availableForOptions": ["bookmate"], "disclaimers": [],
+        "storageDir": "", "durationMs": 180000, "fileSize": 0,
+        "r128": {"i": -7.99, "tp": 0.67}, "fade": {"inStart": 0.5, "inStop": 1.4, "outStart": 170.2, "outStop": 178.9},
+        "previewDurationMs": 30000, "artists": [artist], "albums": [album],
+        "coverUri": "avatars.yandex.net/get-music-content/9/c.d/%%",
+        "ogImage": "avatars.yandex.net/get-music-content/9/c.d/%%", "lyricsAvailable": True, "type": "music",
+        "rememberPosition": False, "trackSharingFlag": "COVER_ONLY", "lyricsInfo": {"hasAvailableSyncLyrics": True,
+                                                                                    "hasAvailableTextLyrics": True},
+        "derivedColors": {"average": "#5c4f4f", "waveText": "#ffffff", "miniPlayer": "#c49f9f", "accent": "#d5aeae"},
+        "contentWarning": "explicit", "specialAudioResources": ["flac"],
+    }
+
+
+def measure(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        body = func()
+    return (time.perf_counter() - started) / iterations * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tracks", type=int, default=60, help="треков в каждом из 4 миксов")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    mixes = [[Track.de_json(raw_track(mix * 1000 + i), None) for i in range(args.tracks)] for mix in range(4)]
+
+    def legacy():
+        payload = [{"title": "Микс", "tracks": [track.to_dict() for track in tracks]} for tracks in mixes]
+        return json.dumps(jsonable_encoder(payload), ensure_ascii=False).encode("utf-8")
+
+    def compact():
+        payload = [{"title": "Микс", "tracks": [track_summary(track) for track in tracks]} for tracks in mixes]
+        return dumps(payload)
+
+    for name, func in (("to_dict + json", legacy), ("track_summary + orjson", compact)):
+        elapsed, body = measure(func, args.iterations)
+        print(f"{name:<24} {elapsed:8.2f} ms  {len(body) / 1024:9.1f} KiB  gzip {len(gzip.compress(body)) / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
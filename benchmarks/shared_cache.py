@@ -0,0 +1,111 @@
+"""Сколько запросов уходит в Яндекс при N воркерах gunicorn: свой кэш в каждом воркере против общего SQLite.
+
+Для каждого хранилища поднимает стенд Яндекса и gunicorn с `--workers` воркерами, прогоняет одинаковый
+набор запросов (каждый — новым соединением, чтобы они расходились по воркерам) и печатает число
+вызовов стенда по методам API.
+
+Запуск:
+    python benchmarks/shared_cache.py --workers 4 --rounds 3
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from typing import Dict, List
+
+import aiohttp
+
+from load import API_KEY, free_port, start_process, stop_process, wait_ready
+
+BACKENDS = ("memory", "sqlite")
+
+
+def request_paths(rounds: int) -> List[str]:
+    """Экраны приложения: главная (миксы, чарт), карточки треков и альбомов, поиск."""
+    paths = []
+    for _ in range(rounds):
+        paths += ["/mixes", "/chart"]
+        paths += [f"/track/{track_id}" for track_id in range(1, 41)]
+        paths += [f"/album/{album_id}" for album_id in range(1, 11)]
+        paths += [f"/search?query=q{query}" for query in range(5)]
+    return paths
+
+
+async def run(base_url: str, paths: List[str], concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+    # force_close: без keep-alive каждый запрос может попасть в другой воркер
+    connector = aiohttp.TCPConnector(force_close=True)
+    async with aiohttp.ClientSession(connector=connector, headers={"X-API-KEY": API_KEY}) as session:
+        async def fetch(path: str) -> None:
+            nonlocal errors
+            async with semaphore:
+                async with session.get(base_url + path) as response:
+                    await response.read()
+                    errors += response.status >= 400
+
+        await asyncio.gather(*(fetch(path) for path in paths))
+    return errors
+
+
+async def measure(backend: str, workers: int, paths: List[str], concurrency: int,
+                  latency_ms: float) -> Dict[str, int]:
+    upstream_port, port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    upstream = start_process([sys.executable, "benchmarks/fake_upstream.py", "--port", str(upstream_port)],
+                             {"FAKE_LATENCY_MS": str(latency_ms)})
+    try:
+        await wait_ready(f"{upstream_url}/_fake/calls")
+        with tempfile.TemporaryDirectory() as tmp:
+            server = start_process([sys.executable, "-m", "gunicorn", "main:app", "-k", "uvicorn.workers.UvicornWorker",
+                                    "-w", str(workers), "-b", f"127.0.0.1:{port}", "--log-level", "warning"], {
+                "YANDEX_TOKEN": "fake",
+                "YANDEX_BASE_URL": upstream_url,
+                "YANDEX_STORAGE_URL": upstream_url,
+                "YANDEX_AVATARS_URL": upstream_url,
+                "API_KEY": API_KEY,
+                "RATE_LIMIT_PER_KEY": "0",
+                "MAX_CONCURRENT_PER_KEY": "0",
+                "AUDIO_CACHE_DIR": os.path.join(tmp, "audio"),
+                "COVER_CACHE_DIR": os.path.join(tmp, "covers"),
+                "CACHE_BACKEND": backend,
+                "CACHE_SQLITE_PATH": os.path.join(tmp, "cache.sqlite3"),
+            })
+            try:
+                await wait_ready(f"http://127.0.0.1:{port}/openapi.json")
+                errors = await run(f"http://127.0.0.1:{port}", paths, concurrency)
+                if errors:
+                    print(f"  {backend}: {errors} ответов с ошибкой")
+            finally:
+                stop_process(server)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{upstream_url}/_fake/calls") as response:
+                return await response.json()
+    finally:
+        stop_process(upstream)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3, help="сколько раз повторить набор запросов")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=50, help="задержка стенда Яндекса")
+    args = parser.parse_args()
+
+    paths = request_paths(args.rounds)
+    calls = {backend: await measure(backend, args.workers, paths, args.concurrency, args.latency_ms)
+             for backend in BACKENDS}
+
+    print(f"{len(paths)} запросов, {args.workers} воркеров; вызовов API Яндекса:")
+    methods = sorted(set().union(*(calls[backend] for backend in BACKENDS)))
+    print(f"  {'метод':<20}" + "".join(f"{backend:>10}" for backend in BACKENDS))
+    for method in methods + ["всего"]:
+        counts = [sum(calls[backend].values()) if method == "всего" else calls[backend].get(method, 0)
+                  for backend in BACKENDS]
+        print(f"  {method:<20}" + "".join(f"{count:>10}" for count in counts))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
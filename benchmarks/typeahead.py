@@ -0,0 +1,114 @@
+"""Сколько запросов к поиску Яндекса порождает набор текста: /search на каждое нажатие против /suggest.
+
+Пользователи набирают запросы по букве с паузой `--keystroke-ms`. В режиме `search` каждое нажатие —
+`/search?query=<префикс>`, как сейчас делает приложение. В режиме `suggest` нажатия идут в
+`/suggest?part=<префикс>&session=<пользователь>`, а `/search` вызывается один раз по готовому запросу.
+Для каждого режима поднимается свой стенд и сервис; печатается число вызовов поиска в стенде.
+
+Запуск:
+    python benchmarks/typeahead.py --users 20 --keystroke-ms 80
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+from typing import Dict, List
+
+import aiohttp
+
+from load import API_KEY, free_port, start_process, stop_process, wait_ready
+
+ARTISTS = ["the beatles", "beastie boys", "bee gees"]
+MODES = ("search", "suggest")
+
+
+def user_queries(users: int) -> List[str]:
+    """Запрос каждого пользователя: чаще разные треки, иногда одни и те же исполнители."""
+    rng = random.Random(0)
+    return [rng.choice(ARTISTS) if rng.random() < 0.2 else f"трек {rng.randint(1, 999)}" for _ in range(users)]
+
+
+async def type_query(session: aiohttp.ClientSession, base_url: str, mode: str, user: int, query: str,
+                     keystroke: float) -> int:
+    """Набирает `query` по букве; возвращает число ответов с ошибкой."""
+    errors = 0
+    pending: List[asyncio.Task] = []
+
+    async def get(path: str, params: Dict[str, str]) -> None:
+        nonlocal errors
+        async with session.get(base_url + path, params=params) as response:
+            await response.read()
+            errors += response.status >= 400
+
+    for end in range(1, len(query) + 1):
+        prefix = query[:end]
+        if mode == "search":
+            pending.append(asyncio.create_task(get("/search", {"query": prefix})))
+        else:
+            pending.append(asyncio.create_task(get("/suggest", {"part": prefix, "session": f"user{user}"})))
+        await asyncio.sleep(keystroke * random.uniform(0.5, 1.5))
+    if mode == "suggest":
+        pending.append(asyncio.create_task(get("/search", {"query": query})))
+    await asyncio.gather(*pending)
+    return errors
+
+
+async def measure(mode: str, queries: List[str], keystroke: float, latency_ms: float) -> Dict[str, int]:
+    upstream_port, port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    upstream = start_process([sys.executable, "benchmarks/fake_upstream.py", "--port", str(upstream_port)],
+                             {"FAKE_LATENCY_MS": str(latency_ms)})
+    try:
+        await wait_ready(f"{upstream_url}/_fake/calls")
+        with tempfile.TemporaryDirectory() as tmp:
+            server = start_process([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                    "--port", str(port), "--log-level", "warning"], {
+                "YANDEX_TOKEN": "fake",
+                "YANDEX_BASE_URL": upstream_url,
+                "YANDEX_STORAGE_URL": upstream_url,
+                "YANDEX_AVATARS_URL": upstream_url,
+                "API_KEY": API_KEY,
+                "RATE_LIMIT_PER_KEY": "0",
+                "MAX_CONCURRENT_PER_KEY": "0",
+                "AUDIO_CACHE_DIR": os.path.join(tmp, "audio"),
+                "COVER_CACHE_DIR": os.path.join(tmp, "covers"),
+            })
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                await wait_ready(f"{base_url}/openapi.json")
+                async with aiohttp.ClientSession(headers={"X-API-KEY": API_KEY}) as session:
+                    async with session.delete(f"{upstream_url}/_fake/calls"):
+                        pass
+                    errors = await asyncio.gather(*(
+                        type_query(session, base_url, mode, user, query, keystroke)
+                        for user, query in enumerate(queries)))
+                    if sum(errors):
+                        print(f"  {mode}: {sum(errors)} ответов с ошибкой")
+                    async with session.get(f"{upstream_url}/_fake/calls") as response:
+                        return await response.json()
+            finally:
+                stop_process(server)
+    finally:
+        stop_process(upstream)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="сколько пользователей набирают одновременно")
+    parser.add_argument("--keystroke-ms", type=float, default=80, help="средняя пауза между нажатиями")
+    parser.add_argument("--latency-ms", type=float, default=50, help="задержка стенда Яндекса")
+    args = parser.parse_args()
+
+    queries = user_queries(args.users)
+    keystrokes = sum(len(query) for query in queries)
+    print(f"{args.users} пользователей, {keystrokes} нажатий; вызовов поиска Яндекса:")
+    for mode in MODES:
+        calls = await measure(mode, queries, args.keystroke_ms / 1000, args.latency_ms)
+        search, suggest = calls.get("search", 0), calls.get("search_suggest", 0)
+        print(f"  {mode:<8} search={search:<5} search_suggest={suggest:<5} всего={search + suggest}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
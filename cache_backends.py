@@ -0,0 +1,177 @@
+"""Хранилища для кэша метаданных и снапшотов: память процесса или общий для воркеров SQLite-файл.
+
+Под gunicorn каждый воркер — отдельный процесс. С `MemoryBackend` у каждого свой кэш, и одни и
+те же данные запрашиваются у Яндекса N раз. `SqliteBackend` хранит записи в одном файле в режиме
+WAL (читатели не блокируют писателя), поэтому все воркеры на машине видят один кэш, а блокировки
+в той же базе дают обновлять ключ только одному воркеру за раз.
+
+Вызовы SQLite синхронные и идут прямо в event loop, поэтому ожидание занятой базы ограничено
+`busy_timeout` в десятки миллисекунд: не дождались — чтение считается промахом, запись
+пропускается, блокировка не взята. Кэш от этого только реже попадает, но воркер не встаёт.
+"""
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Sequence, Tuple, Union
+
+import orjson
+
+CacheKey = Tuple[str, str]
+# (момент истечения TTL по time.time(), значение)
+Entry = Tuple[float, Any]
+
+DEFAULT_SQLITE_PATH = "metadata_cache.sqlite3"
+# Сколько секунд ждать, пока другой воркер допишет в базу
+DEFAULT_BUSY_TIMEOUT = 0.05
+# Как часто (в записях) SQLite-хранилище подрезает себя до max_entries
+TRIM_EVERY = 100
+# Как часто процесс, ждущий результат другого воркера, заглядывает в хранилище
+PEER_POLL_INTERVAL = 0.05
+
+
+class MemoryBackend:
+    """Записи в OrderedDict текущего процесса, вытеснение по LRU. Блокировки не нужны — хватает single-flight."""
+
+    shared = False
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Entry]" = OrderedDict()
+
+    def get(self, cache_key: CacheKey) -> Optional[Entry]:
+        entry = self._entries.get(cache_key)
+        if entry is not None:
+            self._entries.move_to_end(cache_key)
+        return entry
+
+    def set(self, cache_key: CacheKey, expires_at: float, value: Any) -> None:
+        self._entries[cache_key] = (expires_at, value)
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, kind: Optional[str] = None) -> None:
+        if kind is None:
+            self._entries.clear()
+        else:
+            for cache_key in [k for k in self._entries if k[0] == kind]:
+                del self._entries[cache_key]
+
+    def count(self) -> int:
+        return len(self._entries)
+
+    def acquire(self, cache_key: CacheKey, timeout: float) -> bool:
+        return True
+
+    def release(self, cache_key: CacheKey) -> None:
+        pass
+
+    def is_locked(self, cache_key: CacheKey) -> bool:
+        return False
+
+
+class SqliteBackend:
+    """Записи в SQLite-файле, общем для всех процессов; значения хранятся как JSON (orjson).
+
+    Соединение открывается лениво и заново после fork, поэтому работает и с `gunicorn --preload`.
+    При переполнении вытесняются записи, которые истекают раньше всех.
+    """
+
+    shared = True
+
+    def __init__(self, path: str = DEFAULT_SQLITE_PATH, max_entries: int = 5000,
+                 busy_timeout: float = DEFAULT_BUSY_TIMEOUT) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.busy_timeout = busy_timeout
+        self.busy_errors = 0
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    @property
+    def owner(self) -> str:
+        return f"{os.getpid()}:{id(self)}"
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            # Схема создаётся один раз при подключении — тут можно подождать дольше, чем в запросах
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (kind TEXT NOT NULL, key TEXT NOT NULL, "
+                               "expires_at REAL NOT NULL, value BLOB NOT NULL, PRIMARY KEY (kind, key)) WITHOUT ROWID")
+            connection.execute("CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at)")
+            connection.execute("CREATE TABLE IF NOT EXISTS locks (kind TEXT NOT NULL, key TEXT NOT NULL, "
+                               "owner TEXT NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (kind, key)) WITHOUT ROWID")
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _execute(self, sql: str, parameters: Sequence[Any] = ()) -> Optional[sqlite3.Cursor]:
+        """Запрос к базе; None, если база занята другим воркером дольше `busy_timeout`."""
+        try:
+            return self.db.execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            self.busy_errors += 1
+            return None
+
+    def get(self, cache_key: CacheKey) -> Optional[Entry]:
+        cursor = self._execute("SELECT expires_at, value FROM entries WHERE kind = ? AND key = ?", cache_key)
+        row = cursor.fetchone() if cursor is not None else None
+        if row is None:
+            return None
+        return row[0], orjson.loads(row[1])
+
+    def set(self, cache_key: CacheKey, expires_at: float, value: Any) -> None:
+        cursor = self._execute("INSERT OR REPLACE INTO entries (kind, key, expires_at, value) VALUES (?, ?, ?, ?)",
+                               (*cache_key, expires_at, orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)))
+        if cursor is None:
+            return
+        self._writes += 1
+        if self._writes % TRIM_EVERY == 0:
+            self._trim()
+
+    def _trim(self) -> None:
+        excess = self.count() - self.max_entries
+        if excess > 0:
+            self._execute("DELETE FROM entries WHERE (kind, key) IN "
+                          "(SELECT kind, key FROM entries ORDER BY expires_at LIMIT ?)", (excess,))
+
+    def delete(self, kind: Optional[str] = None) -> None:
+        if kind is None:
+            self.db.execute("DELETE FROM entries")
+        else:
+            self.db.execute("DELETE FROM entries WHERE kind = ?", (kind,))
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def acquire(self, cache_key: CacheKey, timeout: float) -> bool:
+        """Берёт блокировку ключа на `timeout` секунд; чужая просроченная блокировка перехватывается.
+
+        Занятая база — как занятый ключ: False, и вызывающий ждёт результат другого воркера.
+        """
+        now = time.time()
+        cursor = self._execute(
+            "INSERT INTO locks (kind, key, owner, expires_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (kind, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE locks.expires_at < ?",
+            (*cache_key, self.owner, now + timeout, now))
+        return cursor is not None and cursor.rowcount == 1
+
+    def release(self, cache_key: CacheKey) -> None:
+        # Не удалось снять — блокировка истечёт сама через `timeout` из acquire
+        self._execute("DELETE FROM locks WHERE kind = ? AND key = ? AND owner = ?", (*cache_key, self.owner))
+
+    def is_locked(self, cache_key: CacheKey) -> bool:
+        cursor = self._execute("SELECT 1 FROM locks WHERE kind = ? AND key = ? AND expires_at >= ?",
+                               (*cache_key, time.time()))
+        return cursor is not None and cursor.fetchone() is not None
+
+
+Backend = Union[MemoryBackend, SqliteBackend]
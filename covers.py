@@ -0,0 +1,66 @@
+"""Обложки треков и альбомов через сервис: скачиваются один раз и отдаются с диска.
+
+Приложение грузило обложки напрямую с avatars.yandex.net, каждая — отдельный холодный запрос с
+устройства. Здесь обложка нужного размера скачивается по шаблону `cover_uri` (как в
+`download_cover_bytes_async` библиотеки), кладётся в `FileCache` и отдаётся с долгим
+`Cache-Control` и ETag. Качается она не через клиент API, а через сессию хранилища: загрузки
+обложек не занимают слоты и circuit breaker вызовов API.
+"""
+import asyncio
+import hashlib
+import os
+from contextlib import nullcontext
+from typing import Awaitable, Callable, Optional
+
+import aiohttp
+from fastapi import HTTPException
+
+from audio_stream import download_to_file, replace_origin
+from projections import cover_url
+
+COVER_SIZE_PATTERN = r'^\d{2,4}x\d{2,4}$'
+COVER_MEDIA_TYPE = 'image/jpeg'
+# Обложка по id почти никогда не меняется: браузер и CDN могут держать её месяц
+COVER_MAX_AGE = 30 * 24 * 3600
+DEFAULT_COVER_CACHE_MAX_BYTES = 256 * 1024 ** 2
+# Сколько фоновых загрузок обложек идёт одновременно
+DEFAULT_COVER_PREFETCH_CONCURRENCY = 8
+
+
+def cover_cache_key(kind: str, item_id: str, size: str) -> str:
+    return f"{kind}:{item_id}:{size}"
+
+
+def cover_etag(path: str) -> str:
+    """ETag от имени файла (sha1 ключа) и размера: mtime меняется при каждом попадании в LRU и не годится."""
+    digest = hashlib.sha1(f"{os.path.basename(path)}:{os.path.getsize(path)}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def track_cover_uri(track) -> Optional[str]:
+    """Шаблон обложки трека; у треков без своей обложки берётся обложка альбома."""
+    if track.cover_uri:
+        return track.cover_uri
+    album = track.albums[0] if track.albums else None
+    return album.cover_uri if album else None
+
+
+def cover_fetcher(session: aiohttp.ClientSession, uri: str, size: str, read_timeout: float,
+                  avatars_url: Optional[str] = None,
+                  limit: Optional[asyncio.Semaphore] = None) -> Callable[[str], Awaitable[None]]:
+    """Загрузка обложки в файл для `FileCache`.
+
+    `avatars_url` подменяет хост (для локального стенда); `limit` ограничивает число одновременных
+    загрузок — им ограничивается фоновый прогрев, чтобы он не занял все соединения.
+    """
+    url = cover_url(uri, size)
+    if avatars_url:
+        url = replace_origin(url, avatars_url)
+
+    async def fetch(path: str) -> None:
+        async with limit or nullcontext():
+            try:
+                await download_to_file(session, url, path, read_timeout)
+            except aiohttp.ClientError as e:
+                raise HTTPException(status_code=502, detail=f"Не удалось получить обложку: {e}")
+    return fetch
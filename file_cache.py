@@ -0,0 +1,146 @@
+"""Файловый кэш с бюджетом в байтах, LRU-вытеснением и single-flight загрузкой.
+
+Файлы лежат в одном каталоге под именем sha1 от ключа, поэтому один и тот же ключ
+(например, трек + кодек + битрейт) всегда попадает в один файл, а параллельные промахи
+по ключу превращаются в одну загрузку.
+
+Каталог общий для всех воркеров gunicorn, а индекс у каждого свой. Поэтому файл, которого
+нет в индексе, ищется на диске; порядок LRU хранится в mtime файлов, а бюджет время от времени
+пересчитывается по всему каталогу, чтобы вытеснялись и файлы, скачанные другими воркерами.
+"""
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+PART_SUFFIX = ".part"
+# Недокачанный файл, который столько секунд не менялся, брошен (воркер упал); более свежий,
+# возможно, ещё качает другой воркер
+STALE_PART_AGE = 600
+# Как часто после загрузок пересчитывать занятое место по всему каталогу
+RESCAN_INTERVAL = 10
+
+
+class FileCache:
+    """Каталог файлов, суммарный размер которых не превышает `max_bytes`."""
+
+    def __init__(self, directory: str, max_bytes: int, suffix: str = "") -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._scanned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Перечитывает индекс из каталога (с файлами всех воркеров) и вытесняет лишнее."""
+        files = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if entry.name.endswith(PART_SUFFIX):
+                    if now - stat.st_mtime > STALE_PART_AGE:
+                        os.remove(entry.path)
+                    continue
+            except FileNotFoundError:
+                # Файл успел удалить другой воркер
+                continue
+            files.append((stat.st_mtime, entry.path, stat.st_size))
+
+        self._entries.clear()
+        self.total_bytes = 0
+        for _, path, size in sorted(files):
+            self._entries[path] = size
+            self.total_bytes += size
+        self._scanned_at = time.monotonic()
+        self._evict()
+
+    def path_for(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + self.suffix)
+
+    def get(self, key: str) -> Optional[str]:
+        """Путь к закэшированному файлу или None; попадание поднимает файл в LRU."""
+        path = self.path_for(key)
+        try:
+            # mtime хранит порядок LRU между перезапусками и между воркерами
+            os.utime(path)
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            # Файл вытеснил другой воркер
+            self.total_bytes -= self._entries.pop(path, 0)
+            return None
+        if path not in self._entries:
+            # Файл скачал другой воркер — берём его в свой индекс
+            self.total_bytes += size
+            self._entries[path] = size
+        self._entries.move_to_end(path)
+        return path
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[str], Awaitable[None]]) -> str:
+        """Возвращает путь к файлу, при промахе скачивая его через `fetch(tmp_path)`.
+
+        Загрузка идёт отдельной задачей: все параллельные промахи по ключу ждут её, а отмена
+        одного из запросов (клиент закрыл соединение) не прерывает загрузку для остальных.
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        task = self._inflight.get(key) or self._start(key, fetch)
+        return await asyncio.shield(task)
+
+    def prefetch(self, key: str, fetch: Callable[[str], Awaitable[None]]) -> None:
+        """Запускает загрузку в фоне, если файла нет в кэше и он ещё не качается."""
+        if self.get(key) is None and key not in self._inflight:
+            self._start(key, fetch)
+
+    def _start(self, key: str, fetch: Callable[[str], Awaitable[None]]) -> asyncio.Task:
+        task = asyncio.create_task(self._fill(key, fetch))
+        self._inflight[key] = task
+
+        def done(finished: asyncio.Task) -> None:
+            self._inflight.pop(key, None)
+            # Ошибку фоновой загрузки может быть некому получить — забираем её, чтобы не было warning
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(done)
+        return task
+
+    async def _fill(self, key: str, fetch: Callable[[str], Awaitable[None]]) -> str:
+        path = self.path_for(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}{PART_SUFFIX}"
+        try:
+            await fetch(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        size = os.path.getsize(path)
+        self.total_bytes += size - self._entries.pop(path, 0)
+        self._entries[path] = size
+        if self.total_bytes > self.max_bytes or time.monotonic() - self._scanned_at >= RESCAN_INTERVAL:
+            self._load_index()
+        return path
+
+    def _evict(self) -> None:
+        # Самый свежий файл не трогаем, даже если он один больше всего бюджета
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
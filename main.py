@@ -1,37 +1,189 @@
-from fastapi import FastAPI, Query
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, Path, Query
 from fastapi import Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from yandex_music import Client, Playlist
-from fastapi.responses import FileResponse
-from fastapi.responses import StreamingResponse
-from tempfile import NamedTemporaryFile
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES
+from yandex_music import ClientAsync, Playlist
+from yandex_music.exceptions import NetworkError, NotFoundError, UnauthorizedError
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from yandex_music.landing.chart_item import ChartItem
 from yandex_music.track.track import Track
-from typing import List, Dict, Any
+from yandex_music.track_short import TrackShort
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 load_dotenv()
 import os
+from audio_stream import (CODEC_MEDIA_TYPES, DEFAULT_STORAGE_POOL_SIZE, DirectLinkResolver, StorageSession,
+                          audio_etag, download_to_file, proxy_audio)
+from auth import DEFAULT_BURST, DEFAULT_MAX_CONCURRENT, DEFAULT_RATE, ApiKeyMiddleware, parse_keys
+from cache_backends import DEFAULT_SQLITE_PATH, MemoryBackend, SqliteBackend
+from covers import (COVER_MAX_AGE, COVER_MEDIA_TYPE, COVER_SIZE_PATTERN, DEFAULT_COVER_CACHE_MAX_BYTES,
+                    DEFAULT_COVER_PREFETCH_CONCURRENCY, cover_cache_key, cover_etag, cover_fetcher, track_cover_uri)
+from file_cache import FileCache
+from metadata_cache import DEFAULT_MAX_ENTRIES, DEFAULT_MAX_STALE, DEFAULT_TTLS, MetadataCache
+from metrics import MetricsMiddleware, SlowRequestProfiler, render as render_metrics, timed
+from projections import (COVER_SIZE, TRACK_FIELDS, album_summary, dumps, json_response, parse_fields, search_summary,
+                         select_fields, suggest_summary, track_summary)
+from resilience import (DEFAULT_FAILURE_THRESHOLD, DEFAULT_MAX_CONCURRENCY, DEFAULT_MAX_CONCURRENCY_PER_ENDPOINT,
+                        DEFAULT_QUEUE_TIMEOUT, DEFAULT_RESET_TIMEOUT, DEFAULT_RETRIES, CircuitOpenError,
+                        UpstreamGovernor)
+from snapshot import Snapshot, etag_matches
+from suggest import DEFAULT_DEBOUNCE, DEFAULT_MAX_RESULTS, SuggestCache, Superseded
+from track_batcher import DEFAULT_MAX_BATCH, TrackBatcher
+from yandex_client import ClientManager, DEFAULT_POOL_SIZE
 
-app = FastAPI()
+# Можно хранить токен в переменной окружения или захардкодить временно
+YANDEX_TOKEN = os.getenv("YANDEX_TOKEN")
+YANDEX_POOL_SIZE = int(os.getenv("YANDEX_POOL_SIZE", DEFAULT_POOL_SIZE))
+# Адреса API и серверов с аудио; переопределяются, чтобы гонять сервис против benchmarks/fake_upstream.py
+YANDEX_BASE_URL = os.getenv("YANDEX_BASE_URL")
+YANDEX_STORAGE_URL = os.getenv("YANDEX_STORAGE_URL")
+YANDEX_AVATARS_URL = os.getenv("YANDEX_AVATARS_URL")
+
+# Защита от сбоев Яндекса: лимиты одновременных вызовов, повторы, circuit breaker, хеджирование (0 — выключено)
+UPSTREAM_HEDGE_DELAY_MS = float(os.getenv("UPSTREAM_HEDGE_DELAY_MS", "0"))
+upstream_governor = UpstreamGovernor(
+    max_concurrency=int(os.getenv("UPSTREAM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+    max_concurrency_per_endpoint=int(os.getenv("UPSTREAM_MAX_CONCURRENCY_PER_ENDPOINT",
+                                               DEFAULT_MAX_CONCURRENCY_PER_ENDPOINT)),
+    queue_timeout=float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", DEFAULT_QUEUE_TIMEOUT)),
+    retries=int(os.getenv("UPSTREAM_RETRIES", DEFAULT_RETRIES)),
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+    reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", DEFAULT_RESET_TIMEOUT)),
+    hedge_delay=UPSTREAM_HEDGE_DELAY_MS / 1000 if UPSTREAM_HEDGE_DELAY_MS > 0 else None,
+)
+
+# Один клиент на процесс: keep-alive соединения и account_status только при инициализации
+client_manager = ClientManager(YANDEX_TOKEN, base_url=YANDEX_BASE_URL, pool_size=YANDEX_POOL_SIZE,
+                               governor=upstream_governor)
+
+# Сколько плейлистов /mixes загружает параллельно
+MIXES_CONCURRENCY = int(os.getenv("MIXES_CONCURRENCY", "4"))
+DEFAULT_MIXES_LIMIT = 4
+MAX_MIXES_LIMIT = 20
+# Таймаут чтения аудио и обложек с серверов хранилища. Вызовы API отдельным wait_for не оборачиваются:
+# их ограничивают таймаут попытки в клиенте и повторы upstream_governor, а внешний таймаут обрывал бы повторы
+UPSTREAM_CALL_TIMEOUT = float(os.getenv("UPSTREAM_CALL_TIMEOUT", "10"))
+
+direct_links = DirectLinkResolver(storage_url=YANDEX_STORAGE_URL)
+# Аудио качается через свою сессию: долгие потоки не должны занимать пул соединений API
+storage = StorageSession(int(os.getenv("STORAGE_POOL_SIZE", DEFAULT_STORAGE_POOL_SIZE)))
+
+# Кэш аудиофайлов на диске: ключ — трек + кодек + битрейт, при переполнении вытесняются давно игравшие
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "audio_cache")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+audio_cache = FileCache(AUDIO_CACHE_DIR, AUDIO_CACHE_MAX_BYTES)
+
+# Кэш обложек на диске: ключ — вид (трек/альбом), id и размер
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", "cover_cache")
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", DEFAULT_COVER_CACHE_MAX_BYTES))
+cover_cache = FileCache(COVER_CACHE_DIR, COVER_CACHE_MAX_BYTES)
+# Обложки скольких первых треков каждого микса прогревать, пока собирается /mixes (0 — не прогревать)
+COVER_PREFETCH_PER_MIX = int(os.getenv("COVER_PREFETCH_PER_MIX", "20"))
+# Сколько фоновых загрузок обложек идёт одновременно; запросы /cover этот лимит не ждут
+cover_prefetch_limit = asyncio.Semaphore(
+    int(os.getenv("COVER_PREFETCH_CONCURRENCY", DEFAULT_COVER_PREFETCH_CONCURRENCY)))
+
+# Хранилище кэша: memory — свой кэш в каждом воркере, sqlite — один файл на все воркеры машины
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+if CACHE_BACKEND == "sqlite":
+    cache_backend = SqliteBackend(os.getenv("CACHE_SQLITE_PATH", DEFAULT_SQLITE_PATH),
+                                  max_entries=METADATA_CACHE_MAX_ENTRIES)
+else:
+    cache_backend = MemoryBackend(METADATA_CACHE_MAX_ENTRIES)
+
+# Кэш метаданных: TTL в секундах для каждого вида данных переопределяется через METADATA_TTL_<ВИД>
+metadata_cache = MetadataCache(
+    {kind: float(os.getenv(f"METADATA_TTL_{kind.upper()}", ttl)) for kind, ttl in DEFAULT_TTLS.items()},
+    max_entries=METADATA_CACHE_MAX_ENTRIES,
+    max_stale=float(os.getenv("METADATA_CACHE_MAX_STALE", DEFAULT_MAX_STALE)),
+    backend=cache_backend,
+    # Яндекс недоступен — отдаём последнюю сохранённую запись, даже если она старше max_stale
+    fallback_on=(NetworkError, asyncio.TimeoutError),
+)
+
+# Подсказки /suggest: кэш по префиксам в памяти и пауза перед походом в Яндекс для сеанса набора
+suggest_cache = SuggestCache(
+    lambda part: _load_suggest(part),
+    ttl=float(os.getenv("SUGGEST_TTL", DEFAULT_TTLS["search"])),
+    max_results=int(os.getenv("SUGGEST_MAX_RESULTS", DEFAULT_MAX_RESULTS)),
+    debounce=float(os.getenv("SUGGEST_DEBOUNCE_MS", DEFAULT_DEBOUNCE * 1000)) / 1000,
+)
+SEARCH_TYPES = ('all', 'artist', 'user', 'album', 'playlist', 'track', 'podcast', 'podcast_episode')
+
+# Одиночные /track/{id}, пришедшие в пределах окна, уходят в Яндекс одним client.tracks()
+TRACK_BATCH_WINDOW_MS = float(os.getenv("TRACK_BATCH_WINDOW_MS", "5"))
+track_batcher = TrackBatcher(
+    lambda track_ids: client_manager.call(lambda client: client.tracks(track_ids)),
+    window=TRACK_BATCH_WINDOW_MS / 1000,
+    max_batch=DEFAULT_MAX_BATCH,
+)
+MAX_TRACKS_PER_REQUEST = 200
+
+# Как часто в секундах пересобирается снапшот /chart
+CHART_REFRESH_INTERVAL = float(os.getenv("CHART_REFRESH_INTERVAL", "600"))
+
+# Профилирование медленных запросов (нужен pyinstrument); включается и через POST /debug/profiler
+slow_request_profiler = SlowRequestProfiler(
+    os.getenv("PROFILE_DIR", "profiles"),
+    threshold_ms=float(os.getenv("PROFILE_SLOW_MS", "1000")),
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0.1")),
+    enabled=os.getenv("PROFILE_SLOW_REQUESTS", "").lower() in ("1", "true"),
+)
+TRACK_ID_RE = re.compile(r'^\d+(:\d+)?$')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await client_manager.get()
+    except Exception as e:
+        # Не валим старт: клиент будет создан лениво при первом запросе
+        print(f"Не удалось инициализировать клиент Яндекс Музыки при старте: {e}")
+    storage.open()
+    chart_snapshot.start()
+    yield
+    await chart_snapshot.stop()
+    await storage.close()
+    await client_manager.close()
 
-API_KEY = os.getenv("API_KEY")
 
-@app.middleware("http")
-async def verify_api_key(request: Request, call_next):
-    if request.url.path.startswith("/docs") or request.url.path.startswith("/openapi.json"):
-        return await call_next(request)
+app = FastAPI(lifespan=lifespan)
 
-    # Попробовать сначала заголовок
-    key = request.headers.get("X-API-KEY")
+# Сжимаем JSON-ответы; аудио и частичные (206) ответы GZipMiddleware не трогает.
+# NDJSON-поток /mixes/stream не сжимаем, иначе строки копились бы в буфере gzip (SSE исключён по умолчанию)
+app.add_middleware(GZipMiddleware, minimum_size=1024,
+                   exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",))
 
-    # Если нет — попробовать query-параметр
-    if key is None:
-        key = request.query_params.get("apiKey")
 
-    if key != API_KEY:
-        raise HTTPException(status_code=403, detail="Forbidden: Invalid API Key")
+@app.exception_handler(NotFoundError)
+async def not_found_handler(request: Request, exc: NotFoundError):
+    return JSONResponse(status_code=404, content={"detail": str(exc) or "Не найдено"})
 
-    return await call_next(request)
+
+@app.exception_handler(NetworkError)
+@app.exception_handler(asyncio.TimeoutError)
+async def upstream_unavailable_handler(request: Request, exc: Exception):
+    # Сбой сети, открытый circuit breaker или переполненная очередь к Яндексу — повторить позже, а не 500
+    retry_after = exc.retry_after if isinstance(exc, CircuitOpenError) else 1
+    return JSONResponse(status_code=503, content={"detail": f"API Яндекс Музыки недоступно: {exc}"},
+                        headers={"Retry-After": str(max(1, round(retry_after)))})
+
+# Ключи клиентов: API_KEY и/или API_KEYS через запятую; лимиты считаются для каждого ключа отдельно.
+# Один общий API_KEY встроен во все копии приложения — лимит на него был бы лимитом на весь сервис,
+# поэтому по умолчанию лимиты включаются, только когда заданы ключи клиентов в API_KEYS
+PER_KEY_LIMITS = bool(os.getenv("API_KEYS"))
+app.add_middleware(
+    ApiKeyMiddleware,
+    keys=parse_keys(os.getenv("API_KEY"), os.getenv("API_KEYS")),
+    rate=float(os.getenv("RATE_LIMIT_PER_KEY", DEFAULT_RATE if PER_KEY_LIMITS else 0)),
+    burst=int(os.getenv("RATE_LIMIT_BURST", DEFAULT_BURST)),
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_PER_KEY", DEFAULT_MAX_CONCURRENT if PER_KEY_LIMITS else 0)),
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -41,176 +193,502 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Можно хранить токен в переменной окружения или захардкодить временно
-YANDEX_TOKEN = os.getenv("YANDEX_TOKEN")
+# Снаружи всех middleware: в метрики и Server-Timing попадает и время проверки ключа, и gzip
+app.add_middleware(MetricsMiddleware, profiler=slow_request_profiler)
+
+async def get_client() -> ClientAsync:
+    return await client_manager.get()
+
+
+def cache_bypass(nocache: bool = Query(False, description="Не брать ответ из кэша (для отладки)")) -> bool:
+    return nocache
+
 
+def track_fields(fields: Optional[str] = Query(
+        None, description=f"Поля трека через запятую: {', '.join(TRACK_FIELDS)}")) -> Optional[List[str]]:
+    return parse_fields(fields)
 
-def get_client():
-    return Client(YANDEX_TOKEN).init()
+
+def full_view(full: bool = Query(False, description="Полный to_dict() объектов yandex_music вместо краткой схемы")) -> bool:
+    return full
+
+
+def _cache_key(key: str, full: bool) -> str:
+    return f"{key}|full" if full else key
 
 
 @app.get("/search")
-def search_music(query: str = Query(..., description="Поисковый запрос")):
-    client = get_client()
-    result = client.search(query)
-    return result.to_dict()
+async def search_music(query: str = Query(..., description="Поисковый запрос"),
+                       type: str = Query('all', pattern=f"^({'|'.join(SEARCH_TYPES)})$",
+                                         description="Среди чего искать: all, track, album, artist, playlist, ..."),
+                       page: int = Query(0, ge=0, description="Номер страницы результатов"),
+                       nocache: bool = Depends(cache_bypass), full: bool = Depends(full_view),
+                       fields: Optional[List[str]] = Depends(track_fields)):
+    async def load():
+        result = await client_manager.call(lambda client: client.search(query, type_=type, page=page))
+        return result.to_dict() if full else search_summary(result)
+    result = await metadata_cache.get_or_load('search', _cache_key(f'{type}|{page}|{query}', full), load,
+                                              bypass=nocache)
+    if fields and not full:
+        result = {**result, 'tracks': {**result['tracks'], 'results': select_fields(result['tracks']['results'], fields)}}
+    return json_response(result)
+
+async def _load_suggest(part: str) -> Dict[str, Any]:
+    return suggest_summary(await client_manager.call(lambda client: client.search_suggest(part)))
+
+@app.get("/suggest")
+async def suggest(part: str = Query(..., min_length=1, max_length=100, description="Набранная часть запроса"),
+                  session: Optional[str] = Query(None, max_length=64,
+                                                 description="Id сеанса набора: новое нажатие отменяет ещё не отправленное")):
+    """Подсказки для строки поиска. 204 — в том же сеансе уже пришло более новое нажатие."""
+    try:
+        result = await suggest_cache.suggest(part, session)
+    except Superseded:
+        return Response(status_code=204)
+    return json_response(result)
+
+async def _get_track_dict(track_id: str, nocache: bool, full: bool) -> Dict[str, Any]:
+    async def load():
+        track = await track_batcher.load(track_id)
+        return track.to_dict() if full else track_summary(track)
+    return await metadata_cache.get_or_load('track', _cache_key(track_id, full), load, bypass=nocache)
 
 @app.get("/track/{track_id}")
-def get_track(track_id: int):
-    client = get_client()
-    track = client.tracks([track_id])[0]
-    return track.to_dict()
+async def get_track(track_id: int, nocache: bool = Depends(cache_bypass), full: bool = Depends(full_view),
+                    fields: Optional[List[str]] = Depends(track_fields)):
+    track = await _get_track_dict(str(track_id), nocache, full)
+    return json_response(track if full else select_fields([track], fields)[0])
+
+def _parse_ids(ids: Optional[str]) -> List[str]:
+    """id через запятую без повторов; некорректные id — 400."""
+    parsed = list(dict.fromkeys(item_id.strip() for item_id in (ids or '').split(',') if item_id.strip()))
+    invalid_ids = [item_id for item_id in parsed if not TRACK_ID_RE.match(item_id)]
+    if invalid_ids:
+        raise HTTPException(status_code=400, detail=f"Некорректные id: {', '.join(invalid_ids)}")
+    return parsed
+
+@app.get("/tracks")
+async def get_tracks(ids: str = Query(..., description="ID треков через запятую"),
+                     nocache: bool = Depends(cache_bypass), full: bool = Depends(full_view),
+                     fields: Optional[List[str]] = Depends(track_fields)):
+    """Несколько треков за один запрос. Ненайденные id пропускаются, порядок сохраняется."""
+    track_ids = _parse_ids(ids)
+    if len(track_ids) > MAX_TRACKS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Не больше {MAX_TRACKS_PER_REQUEST} id за запрос")
+
+    # Промахи кэша по всем id склеиваются батчером в один вызов client.tracks()
+    results = await asyncio.gather(*(_get_track_dict(track_id, nocache, full) for track_id in track_ids),
+                                   return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, NotFoundError):
+            raise result
+    tracks = [result for result in results if not isinstance(result, BaseException)]
+    return json_response(tracks if full else select_fields(tracks, fields))
 
 @app.get("/album/{album_id}")
-def get_album(album_id: int):
-    client = get_client()
-    album = client.albums_with_tracks(album_id)
-    return album.to_dict()
+async def get_album(album_id: int, nocache: bool = Depends(cache_bypass), full: bool = Depends(full_view),
+                    fields: Optional[List[str]] = Depends(track_fields)):
+    async def load():
+        album = await client_manager.call(lambda client: client.albums_with_tracks(album_id))
+        return album.to_dict() if full else album_summary(album, with_tracks=True)
+    album = await metadata_cache.get_or_load('album', _cache_key(str(album_id), full), load, bypass=nocache)
+    if fields and not full:
+        album = {**album, 'tracks': select_fields(album['tracks'], fields)}
+    return json_response(album)
+
+def _audio_fetcher(track_id: int, codec: str, bitrate: Optional[int]):
+    """Загрузка трека в файл для кэша: прямая ссылка + потоковая запись на диск."""
+    async def fetch(path: str) -> None:
+        direct_link = await client_manager.call(lambda client: direct_links.resolve(client, track_id, codec, bitrate))
+        await download_to_file(storage.session, direct_link, path, UPSTREAM_CALL_TIMEOUT)
+    return fetch
+
+
+def _audio_cache_key(track_id: int, codec: str, bitrate: Optional[int]) -> str:
+    return f"{track_id}:{codec}:{bitrate or 'max'}"
+
 
 @app.get("/download/{track_id}")
-def download_track(track_id: int):
-    client = get_client()
-    track = client.tracks([track_id])[0]
-    filename = f"track_{track_id}.mp3"
-    track.download(filename)
-    return FileResponse(path=filename, filename=filename, media_type='audio/mpeg')
+async def download_track(track_id: int,
+                         codec: str = Query('mp3', description="Кодек: mp3 или aac"),
+                         bitrate: Optional[int] = Query(192, description="Битрейт в kbps")):
+    cache_key = _audio_cache_key(track_id, codec, bitrate)
+    path = await audio_cache.get_or_fetch(cache_key, _audio_fetcher(track_id, codec, bitrate))
+    filename = f"track_{track_id}.{codec}"
+    return FileResponse(path=path, filename=filename, media_type=CODEC_MEDIA_TYPES.get(codec, 'audio/mpeg'),
+                        headers={'ETag': audio_etag(cache_key)})
 
 @app.get("/stream/{track_id}")
-def stream_track(track_id: int):
-    client = get_client()
-    track = client.tracks([track_id])[0]
+async def stream_track(track_id: int, request: Request,
+                       codec: str = Query('mp3', description="Кодек: mp3 или aac"),
+                       bitrate: Optional[int] = Query(None, description="Битрейт в kbps, по умолчанию максимальный")):
+    media_type = CODEC_MEDIA_TYPES.get(codec, 'audio/mpeg')
+    cache_key = _audio_cache_key(track_id, codec, bitrate)
+
+    # Из кэша: FileResponse сам отвечает 206 на Range. ETag тот же, что у потока при промахе,
+    # иначе перемотка с If-Range после докачки файла получала бы 200 со всем файлом
+    etag = audio_etag(cache_key)
+    cached_path = audio_cache.get(cache_key)
+    if cached_path is not None:
+        return FileResponse(path=cached_path, media_type=media_type, headers={'ETag': etag})
+
+    # Промах: отдаём поток сразу, а файл для следующих воспроизведений докачиваем в фоне
+    # (фоновая загрузка возьмёт уже полученную прямую ссылку из кэша ссылок)
+    direct_link = await client_manager.call(lambda client: direct_links.resolve(client, track_id, codec, bitrate))
+    audio_cache.prefetch(cache_key, _audio_fetcher(track_id, codec, bitrate))
+    return await proxy_audio(storage.session, direct_link, request.headers, media_type, UPSTREAM_CALL_TIMEOUT, etag)
+
+
+async def _cover_uri(kind: str, item_id: str) -> str:
+    """Шаблон ссылки на обложку; трек берётся через батчер, альбом — лёгким client.albums без треков."""
+    async def load():
+        if kind == 'track':
+            uri = track_cover_uri(await track_batcher.load(item_id))
+        else:
+            albums = await client_manager.call(lambda client: client.albums([item_id]))
+            uri = albums[0].cover_uri if albums else None
+        if uri is None:
+            raise NotFoundError(f"Нет обложки: {kind} {item_id}")
+        return uri
+    return await metadata_cache.get_or_load('cover', f'{kind}:{item_id}', load)
+
+
+def _cover_fetcher(uri: str, size: str, limit: Optional[asyncio.Semaphore] = None):
+    return cover_fetcher(storage.session, uri, size, UPSTREAM_CALL_TIMEOUT, YANDEX_AVATARS_URL, limit)
+
+
+async def _cover_path(kind: str, item_id: str, size: str, limit: Optional[asyncio.Semaphore] = None) -> str:
+    """Путь к обложке в кэше; `limit` ограничивает параллельные скачивания при массовом прогреве."""
+    cache_key = cover_cache_key(kind, item_id, size)
+    path = cover_cache.get(cache_key)
+    if path is not None:
+        return path
+    uri = await _cover_uri(kind, item_id)
+    return await cover_cache.get_or_fetch(cache_key, _cover_fetcher(uri, size, limit))
+
+
+def _prefetch_track_covers(tracks) -> None:
+    """Запоминает шаблоны обложек уже загруженных треков и качает обложки в фоне."""
+    for track in tracks:
+        uri = track_cover_uri(track)
+        if uri is None:
+            continue
+        track_id = str(track.id)
+        metadata_cache.put('cover', f'track:{track_id}', uri)
+        cover_cache.prefetch(cover_cache_key('track', track_id, COVER_SIZE),
+                             _cover_fetcher(uri, COVER_SIZE, cover_prefetch_limit))
+
+
+@app.get("/cover/{kind}/{item_id}")
+async def get_cover(request: Request, item_id: int, kind: str = Path(..., pattern='^(track|album)$'),
+                    size: str = Query(COVER_SIZE, pattern=COVER_SIZE_PATTERN, description="Размер, например 400x400")):
+    """Обложка трека или альбома с диска сервиса; при промахе скачивается с avatars.yandex.net."""
+    path = await _cover_path(kind, str(item_id), size)
+    etag = cover_etag(path)
+    headers = {'Cache-Control': f'public, max-age={COVER_MAX_AGE}', 'ETag': etag}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path=path, media_type=COVER_MEDIA_TYPE, headers=headers)
+
+
+@app.post("/covers/prefetch")
+async def prefetch_covers(tracks: Optional[str] = Query(None, description="ID треков через запятую"),
+                          albums: Optional[str] = Query(None, description="ID альбомов через запятую"),
+                          size: str = Query(COVER_SIZE, pattern=COVER_SIZE_PATTERN)):
+    """Параллельно прогревает кэш обложек, чтобы экран со списком открылся без холодных загрузок."""
+    items = [('track', item_id) for item_id in _parse_ids(tracks)] + [('album', item_id) for item_id in _parse_ids(albums)]
+    if len(items) > MAX_TRACKS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"Не больше {MAX_TRACKS_PER_REQUEST} id за запрос")
+    results = await asyncio.gather(*(_cover_path(kind, item_id, size, cover_prefetch_limit) for kind, item_id in items),
+                                   return_exceptions=True)
+    failed = [f'{kind}:{item_id}' for (kind, item_id), result in zip(items, results) if isinstance(result, BaseException)]
+    return {"cached": len(items) - len(failed), "failed": failed}
+
+
+def _parse_mix_source(playlist_data_source) -> Optional[Dict[str, Any]]:
+    """Достаёт из элемента блока 'personal-playlists' заголовок, владельца, kind и обложку плейлиста."""
+    title = 'Название неизвестно'
+    owner_uid = None
+    playlist_kind = None
+    cover_url = None
+    track_count_from_source = 0
+
+    if isinstance(playlist_data_source, dict):
+        title = playlist_data_source.get('title', 'Название неизвестно')
+        playlist_kind = playlist_data_source.get('kind')
+        owner_info = playlist_data_source.get('owner', {})
+        owner_uid = owner_info.get('uid') if isinstance(owner_info, dict) else None
+        cover_info = playlist_data_source.get('cover', {})
+        cover_uri_template = cover_info.get('uri') if isinstance(cover_info, dict) else None
+        if cover_uri_template:
+            cover_url = f"https://{cover_uri_template.replace('%%', '200x200')}"
+        track_count_from_source = playlist_data_source.get('track_count', 0)
+    elif isinstance(playlist_data_source, Playlist):
+        title = getattr(playlist_data_source, 'title', 'Название неизвестно')
+        playlist_kind = getattr(playlist_data_source, 'kind', None)
+        if hasattr(playlist_data_source, 'owner') and playlist_data_source.owner:
+            owner_uid = getattr(playlist_data_source.owner, 'uid', None)
+        if hasattr(playlist_data_source, 'cover') and playlist_data_source.cover:
+            cover_uri_template = getattr(playlist_data_source.cover, 'uri', None)
+            if cover_uri_template:
+                cover_url = f"https://{cover_uri_template.replace('%%', '200x200')}"
+        track_count_from_source = getattr(playlist_data_source, 'track_count', 0)
+    else:
+        return None
+
+    return {
+        'title': title,
+        'owner_uid': owner_uid,
+        'kind': playlist_kind,
+        'cover_image_url': cover_url,
+        'track_count_from_data': track_count_from_source,
+    }
+
+
+async def _fetch_mix_tracks(client: ClientAsync, mix: Dict[str, Any], semaphore: asyncio.Semaphore,
+                            full: bool) -> Optional[List[Dict[str, Any]]]:
+    """Загружает треки плейлиста микса. При ошибке или таймауте — None."""
+    owner_uid, playlist_kind = mix['owner_uid'], mix['kind']
+    if owner_uid is None or playlist_kind is None:
+        return []
+
+    async def fetch() -> List[Dict[str, Any]]:
+        # users_playlists уже содержит треки, отдельный fetch_tracks повторил бы тот же запрос
+        full_playlist_obj = await client.users_playlists(user_id=owner_uid, kind=playlist_kind)
+        if not full_playlist_obj or not full_playlist_obj.tracks:
+            return []
 
-    temp_file = NamedTemporaryFile(delete=False, suffix=".mp3")
-    track.download(temp_file.name)
-    temp_file.seek(0)
+        track_objects_from_playlist = list(full_playlist_obj.tracks)
+        if any(t_short and t_short.track is None for t_short in track_objects_from_playlist):
+            track_ids_to_fetch = [
+                str(t_short.id) for t_short in track_objects_from_playlist
+                if t_short and t_short.id is not None
+            ]
+            track_objects_from_playlist = await client.tracks(track_ids_to_fetch) if track_ids_to_fetch else []
+
+        # Обложки первых треков качаются в фоне, пока собирается ответ
+        if COVER_PREFETCH_PER_MIX:
+            _prefetch_track_covers(
+                track_obj.track if isinstance(track_obj, TrackShort) else track_obj
+                for track_obj in track_objects_from_playlist[:COVER_PREFETCH_PER_MIX] if track_obj
+            )
+
+        with timed('to_dict' if full else 'track_summary'):
+            if full:
+                return [track_obj.to_dict() for track_obj in track_objects_from_playlist if track_obj]
+            return [
+                track_summary(track_obj.track if isinstance(track_obj, TrackShort) else track_obj)
+                for track_obj in track_objects_from_playlist if track_obj
+            ]
 
-    return StreamingResponse(temp_file, media_type="audio/mpeg")
+    try:
+        async with semaphore:
+            return await fetch()
+    except Exception as e_fetch:
+        print(
+            f"    Ошибка при получении треков для плейлиста '{mix['title']}' (OwnerUID: {owner_uid}, Kind: {playlist_kind}): {e_fetch!r}")
+        return None
+
+
+def _collect_mix_sources(landing, limit: int) -> List[Dict[str, Any]]:
+    """Первые `limit` миксов из блоков 'personal-playlists' ответа landing()."""
+    mixes: List[Dict[str, Any]] = []
+    if not landing or not landing.blocks:
+        print("Блок 'personal-playlists' не найден на главной странице.")
+        return mixes
+
+    processed_playlists_count = 0
+    for block in landing.blocks:
+        if block.type != 'personal-playlists':
+            continue
+        processed_playlists_count += 1
+
+        for entity in block.entities or []:
+            if len(mixes) >= limit:
+                break
 
-@app.get("/mixes")
-def get_user_mixes_final():
-    client = get_client()
-    mixes_output = []
+            wrapper_data = entity.data
+            if not hasattr(wrapper_data, 'data') or not wrapper_data.data:
+                continue
+
+            mix = _parse_mix_source(wrapper_data.data)
+            if mix is not None:
+                mixes.append(mix)
+        if len(mixes) >= limit:
+            break
+
+    if processed_playlists_count == 0:
+        print("Не найдено блоков 'personal-playlists' или они пусты.")
+    return mixes
+
+
+async def _fetch_landing(client: ClientAsync):
+    return await client.landing(blocks=['personal-playlists'])
+
+
+def _mix_output(mix: Dict[str, Any], tracks: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    return {
+        'title': mix['title'],
+        'cover_image_url': mix['cover_image_url'],
+        'tracks': tracks or [],
+        'track_count_from_data': mix['track_count_from_data'],
+        'fetched_track_count': len(tracks or []),
+    }
+
+
+def _shape_mix(mix_output: Dict[str, Any], track_limit: Optional[int], fields: Optional[List[str]],
+               full: bool) -> Dict[str, Any]:
+    """Применяет к миксу `track_limit` и `fields` — кэшируется всегда полный список треков."""
+    tracks = mix_output['tracks']
+    if track_limit is not None:
+        tracks = tracks[:track_limit]
+    if fields and not full:
+        tracks = select_fields(tracks, fields)
+    if tracks is mix_output['tracks']:
+        return mix_output
+    return {**mix_output, 'tracks': tracks, 'fetched_track_count': len(tracks)}
+
+
+def _mixes_cache_key(limit: int, full: bool) -> str:
+    return _cache_key(f'personal-playlists|{limit}', full)
+
+
+async def _load_mixes(limit: int = DEFAULT_MIXES_LIMIT, full: bool = False) -> Dict[str, Any]:
+    """Собирает миксы. `complete` = False, если какой-то плейлист не загрузился — такой ответ не кэшируется."""
+    client = await get_client()
+    landing = await _fetch_landing(client)
+    mixes = _collect_mix_sources(landing, limit)
+    if not mixes:
+        return {'mixes': [], 'complete': False}
+
+    # Плейлисты загружаются параллельно, не больше MIXES_CONCURRENCY одновременно
+    semaphore = asyncio.Semaphore(MIXES_CONCURRENCY)
+    tracks_per_mix = await asyncio.gather(*(_fetch_mix_tracks(client, mix, semaphore, full) for mix in mixes))
+
+    mixes_output = [_mix_output(mix, tracks) for mix, tracks in zip(mixes, tracks_per_mix)]
+    return {'mixes': mixes_output, 'complete': all(tracks is not None for tracks in tracks_per_mix)}
+
+
+async def _mix_events(client: ClientAsync, mixes: List[Dict[str, Any]], cache_key: str, full: bool):
+    """Отдаёт (позиция, микс) по мере загрузки плейлистов, а не в порядке выдачи landing.
+
+    Треки загружаются полностью (`track_limit` применяется при отправке), а когда загрузились
+    все плейлисты, ответ кладётся в кэш /mixes: следующий экран откроется без вызовов Яндекса.
+    """
+    semaphore = asyncio.Semaphore(MIXES_CONCURRENCY)
+
+    async def fetch(position: int, mix: Dict[str, Any]):
+        return position, await _fetch_mix_tracks(client, mix, semaphore, full)
+
+    tasks = [asyncio.create_task(fetch(position, mix)) for position, mix in enumerate(mixes)]
+    collected: List[Optional[Dict[str, Any]]] = [None] * len(mixes)
     try:
-        landing = client.landing(blocks=['personal-playlists'])
+        for next_done in asyncio.as_completed(tasks):
+            position, tracks = await next_done
+            mix_output = _mix_output(mixes[position], tracks)
+            if tracks is not None:
+                collected[position] = mix_output
+            yield position, mix_output
+        if collected and all(mix_output is not None for mix_output in collected):
+            metadata_cache.put('mixes', cache_key, {'mixes': collected, 'complete': True})
+    finally:
+        # Клиент отключился — незагруженные плейлисты больше не нужны
+        for task in tasks:
+            task.cancel()
 
-        if not landing or not landing.blocks:
-            print("Блок 'personal-playlists' не найден на главной странице.")
-            return []
 
-        processed_playlists_count = 0
-        for block_idx, block in enumerate(landing.blocks):
-            if block.type == 'personal-playlists':
-                processed_playlists_count += 1
-                if not block.entities:
-                    continue
-
-                for entity_idx, entity in enumerate(block.entities):
-                    if len(mixes_output) >= 4:
-                        break
-
-                    wrapper_data = entity.data
-                    if not hasattr(wrapper_data, 'data') or not wrapper_data.data:
-                        continue
-
-                    playlist_data_source = wrapper_data.data
-
-                    title = 'Название неизвестно'
-                    owner_uid = None
-                    playlist_kind = None
-                    cover_url = None
-                    track_count_from_source = 0
-
-                    if isinstance(playlist_data_source, dict):
-                        title = playlist_data_source.get('title', 'Название неизвестно')
-                        playlist_kind = playlist_data_source.get('kind')
-                        owner_info = playlist_data_source.get('owner', {})
-                        owner_uid = owner_info.get('uid') if isinstance(owner_info, dict) else None
-                        cover_info = playlist_data_source.get('cover', {})
-                        cover_uri_template = cover_info.get('uri') if isinstance(cover_info, dict) else None
-                        if cover_uri_template:
-                            cover_url = f"https://{cover_uri_template.replace('%%', '200x200')}"
-                        track_count_from_source = playlist_data_source.get('track_count', 0)
-                    elif isinstance(playlist_data_source, Playlist):
-                        title = getattr(playlist_data_source, 'title', 'Название неизвестно')
-                        playlist_kind = getattr(playlist_data_source, 'kind', None)
-                        if hasattr(playlist_data_source, 'owner') and playlist_data_source.owner:
-                            owner_uid = getattr(playlist_data_source.owner, 'uid', None)
-                        if hasattr(playlist_data_source, 'cover') and playlist_data_source.cover:
-                            cover_uri_template = getattr(playlist_data_source.cover, 'uri', None)
-                            if cover_uri_template:
-                                cover_url = f"https://{cover_uri_template.replace('%%', '200x200')}"
-                        track_count_from_source = getattr(playlist_data_source, 'track_count', 0)
-                    else:
-                        continue
-
-                    detailed_tracks_list: List[Dict[str, Any]] = []
-
-                    if owner_uid is not None and playlist_kind is not None:
-                        try:
-                            full_playlist_obj = client.users_playlists(user_id=owner_uid, kind=playlist_kind)
-                            if full_playlist_obj:
-                                track_objects_from_playlist = []
-                                if hasattr(full_playlist_obj, 'fetch_tracks') and callable(
-                                        getattr(full_playlist_obj, 'fetch_tracks')):
-                                    fetched_tracks = full_playlist_obj.fetch_tracks()
-                                    if fetched_tracks:
-                                        track_objects_from_playlist.extend(fetched_tracks)
-                                elif hasattr(full_playlist_obj, 'tracks') and full_playlist_obj.tracks:
-                                    track_ids_to_fetch = [
-                                        str(t_short.id) for t_short in full_playlist_obj.tracks
-                                        if t_short and hasattr(t_short, 'id') and t_short.id is not None
-                                    ]
-                                    if track_ids_to_fetch:
-                                        full_track_objects = client.tracks(track_ids_to_fetch)
-                                        track_objects_from_playlist.extend(full_track_objects)
-
-                                for track_obj in track_objects_from_playlist:
-                                    if track_obj:
-                                        detailed_tracks_list.append(track_obj.to_dict())
-                        except Exception as e_fetch:
-                            print(
-                                f"    Ошибка при получении треков для плейлиста '{title}' (OwnerUID: {owner_uid}, Kind: {playlist_kind}): {e_fetch}")
-
-                    mixes_output.append({
-                        'title': title,
-                        'cover_image_url': cover_url,
-                        'tracks': detailed_tracks_list,
-                        'track_count_from_data': track_count_from_source,
-                        'fetched_track_count': len(detailed_tracks_list),
-
-                    })
-            if len(mixes_output) >= 4:
-                break
+async def _cached_mix_events(mixes_output: List[Dict[str, Any]]):
+    for position, mix_output in enumerate(mixes_output):
+        yield position, mix_output
+
+
+async def _encode_mix_events(events, stream_format: str, track_limit: Optional[int],
+                             fields: Optional[List[str]], full: bool):
+    async for position, mix_output in events:
+        line = dumps({'position': position, **_shape_mix(mix_output, track_limit, fields, full)})
+        if stream_format == 'sse':
+            yield b'event: mix\ndata: ' + line + b'\n\n'
+        else:
+            yield line + b'\n'
+    if stream_format == 'sse':
+        yield b'event: done\ndata: {}\n\n'
+
+
+MIX_STREAM_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
 
-        if processed_playlists_count == 0:
-            print("Не найдено блоков 'personal-playlists' или они пусты.")
 
-        return mixes_output
+@app.get("/mixes")
+async def get_user_mixes_final(limit: int = Query(DEFAULT_MIXES_LIMIT, ge=1, le=MAX_MIXES_LIMIT),
+                               track_limit: Optional[int] = Query(None, ge=0),
+                               nocache: bool = Depends(cache_bypass), full: bool = Depends(full_view),
+                               fields: Optional[List[str]] = Depends(track_fields)):
+    try:
+        result = await metadata_cache.get_or_load('mixes', _mixes_cache_key(limit, full),
+                                                  lambda: _load_mixes(limit, full), bypass=nocache,
+                                                  cacheable=lambda value: value['complete'])
+        return json_response([_shape_mix(mix, track_limit, fields, full) for mix in result['mixes']])
 
     except Exception as e:
+        if isinstance(e, (NetworkError, asyncio.TimeoutError)):
+            raise
+        if isinstance(e, UnauthorizedError):
+            await client_manager.invalidate()
         print(f"КРИТИЧЕСКАЯ ОШИБКА в get_user_mixes_final: {e}")
         # traceback.print_exc() # Убрано
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
 
-@app.get("/chart")
-def get_charts_data_structured() -> Dict[str, Any]:
+
+@app.get("/mixes/stream")
+async def stream_user_mixes(format: str = Query('ndjson', pattern='^(ndjson|sse)$'),
+                            limit: int = Query(DEFAULT_MIXES_LIMIT, ge=1, le=MAX_MIXES_LIMIT),
+                            track_limit: Optional[int] = Query(None, ge=0),
+                            nocache: bool = Depends(cache_bypass), full: bool = Depends(full_view),
+                            fields: Optional[List[str]] = Depends(track_fields)):
+    """Миксы по одному: строка NDJSON (или событие SSE) на микс, как только загрузился его плейлист.
+
+    Кэш общий с /mixes: свежий ответ отдаётся из него, а полностью загруженный поток его заполняет.
+    """
+    cache_key = _mixes_cache_key(limit, full)
+    cached = None if nocache else metadata_cache.peek('mixes', cache_key)
+    if cached is not None:
+        events = _cached_mix_events(cached['mixes'])
+    else:
+        # landing запрашиваем до начала ответа, чтобы его ошибка вернулась обычным 500 (или 503 при сбое Яндекса)
+        try:
+            client = await get_client()
+            mixes = _collect_mix_sources(await _fetch_landing(client), limit)
+        except Exception as e:
+            if isinstance(e, (NetworkError, asyncio.TimeoutError)):
+                raise
+            if isinstance(e, UnauthorizedError):
+                await client_manager.invalidate()
+            print(f"КРИТИЧЕСКАЯ ОШИБКА в stream_user_mixes: {e}")
+            raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {str(e)}")
+        events = _mix_events(client, mixes, cache_key, full)
+
+    return StreamingResponse(_encode_mix_events(events, format, track_limit, fields, full),
+                             media_type=MIX_STREAM_MEDIA_TYPES[format],
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def _load_chart() -> Dict[str, Any]:
     """
     Извлекает данные о чартах с Яндекс.Музыки и возвращает их в виде структурированного словаря.
     Возвращает словарь с ключами "charts" (список данных о чартах) и "errors" (список ошибок).
-    Каждый чарт содержит: chart_title, chart_cover_image_url (плейсхолдер), track_ids.
+    Каждый чарт содержит: chart_title, chart_cover_image_url (обложка первого трека), track_ids
+    и tracks — краткие данные треков, загруженные пакетными вызовами client.tracks().
     """
-    client = get_client()
-
     # print("\n--- Запрос данных о чартах из client.landing() ---") # Для отладки
 
     output_charts_list: List[Dict[str, Any]] = []
     errors_list: List[str] = []
 
-    requested_blocks = ['chart', 'personal-playlists']
+    requested_blocks = ['chart']
     # print(f"Попытка запросить landing с блоками: {requested_blocks}") # Для отладки
 
     try:
-        landing_data = client.landing(blocks=requested_blocks)
+        client = await get_client()
+        landing_data = await client.landing(blocks=requested_blocks)
 
         if not landing_data or not landing_data.blocks:
             errors_list.append("client.landing() не вернул данные или блоки пусты для запрошенного набора.")
@@ -229,10 +707,9 @@ def get_charts_data_structured() -> Dict[str, Any]:
 
                 current_chart_data: Dict[str, Any] = {
                     "chart_title": block_title,
-                    "chart_cover_image_url": "Пока не реализовано извлечение",
-                    # TODO: Исследовать, как получить обложку блока
-                    "track_ids": []
-                    # "detailed_tracks" удален из этой структуры
+                    "chart_cover_image_url": None,
+                    "track_ids": [],
+                    "tracks": [],
                 }
 
                 entities = getattr(block_obj, 'entities', [])
@@ -265,10 +742,79 @@ def get_charts_data_structured() -> Dict[str, Any]:
         if chart_blocks_processed_count == 0:
             errors_list.append("Не найдено блоков с типом 'chart' в запрошенном наборе.")
 
+        # Треки всех чартов одним набором пакетных вызовов, а не отдельным запросом клиента на каждый трек
+        unique_track_ids = list(dict.fromkeys(
+            track_id for chart in output_charts_list for track_id in chart["track_ids"]))
+        batches = [unique_track_ids[i:i + DEFAULT_MAX_BATCH] for i in range(0, len(unique_track_ids), DEFAULT_MAX_BATCH)]
+        track_batches = await asyncio.gather(*(client.tracks(batch) for batch in batches))
+        summaries = {str(track.id): track_summary(track) for tracks in track_batches for track in tracks if track}
+
+        for chart in output_charts_list:
+            chart["tracks"] = [summaries[track_id] for track_id in chart["track_ids"] if track_id in summaries]
+            if chart["tracks"]:
+                chart["chart_cover_image_url"] = chart["tracks"][0]["cover_url"]
+
         return {"charts": output_charts_list, "errors": errors_list if errors_list else None}
 
     except Exception as e:
+        if isinstance(e, UnauthorizedError):
+            await client_manager.invalidate()
         # print(f"  КРИТИЧЕСКАЯ ОШИБКА при запросе или анализе client.landing(): {e}") # Для отладки
         # traceback.print_exc() # Для отладки
         errors_list.append(f"Критическая ошибка при получении данных Яндекс.Музыки: {str(e)}")
-        return {"charts": [], "errors": errors_list}
\ No newline at end of file
+        return {"charts": [], "errors": errors_list}
+
+
+# Чарт собирается в фоне и отдаётся из памяти готовыми байтами; сборка с ошибками не заменяет предыдущую
+chart_snapshot = Snapshot(_load_chart, interval=CHART_REFRESH_INTERVAL, is_complete=lambda value: not value['errors'],
+                          name='chart', backend=cache_backend)
+
+
+@app.get("/chart")
+async def get_charts_data_structured(request: Request, nocache: bool = Depends(cache_bypass)):
+    if nocache:
+        await chart_snapshot.refresh(force=True)
+    body, etag = await chart_snapshot.get()
+    if etag is None:
+        return Response(content=body, media_type='application/json')
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers={'ETag': etag})
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
+
+
+@app.get("/cache/stats")
+async def get_cache_stats() -> Dict[str, Any]:
+    """Счётчики попаданий и промахов кэша метаданных."""
+    return {**metadata_cache.stats(), "suggest": suggest_cache.stats()}
+
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(content=render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.get("/debug/upstream")
+async def get_upstream_status() -> Dict[str, Any]:
+    """Свободные слоты и состояние circuit breaker по эндпоинтам API Яндекса."""
+    return upstream_governor.stats()
+
+
+@app.get("/debug/profiler")
+async def get_profiler_status() -> Dict[str, Any]:
+    return slow_request_profiler.status()
+
+
+@app.post("/debug/profiler")
+async def configure_profiler(enabled: Optional[bool] = None, threshold_ms: Optional[float] = Query(None, ge=0),
+                             sample_rate: Optional[float] = Query(None, ge=0, le=1)) -> Dict[str, Any]:
+    """Включает/выключает профилирование медленных запросов без перезапуска."""
+    if enabled and not slow_request_profiler.available:
+        raise HTTPException(status_code=501, detail="Профилировщик недоступен: установите pyinstrument")
+    if enabled is not None:
+        slow_request_profiler.enabled = enabled
+    if threshold_ms is not None:
+        slow_request_profiler.threshold_ms = threshold_ms
+    if sample_rate is not None:
+        slow_request_profiler.sample_rate = sample_rate
+    return slow_request_profiler.status()
@@ -0,0 +1,163 @@
+"""Кэш метаданных (треки, альбомы, поиск, миксы) с TTL и stale-while-revalidate.
+
+У каждого вида данных свой TTL. После истечения TTL запись ещё `max_stale` секунд отдаётся как есть,
+а обновление идёт в фоне; параллельные промахи по одному ключу загружаются один раз.
+
+Записи лежат в хранилище из `cache_backends`: в памяти процесса или в общем для воркеров SQLite.
+С общим хранилищем ключ загружает один воркер, остальные ждут его результат.
+
+Если загрузка упала с ошибкой из `fallback_on` (Яндекс недоступен), отдаётся последняя сохранённая
+запись любой давности — устаревшие данные лучше ошибки.
+"""
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple, Type
+
+from cache_backends import PEER_POLL_INTERVAL, Backend, MemoryBackend
+
+Loader = Callable[[], Awaitable[Any]]
+
+DEFAULT_TTLS = {
+    "track": 24 * 3600,
+    "album": 24 * 3600,
+    "search": 10 * 60,
+    "mixes": 30 * 60,
+    # Шаблон ссылки на обложку трека или альбома (сама картинка лежит в кэше обложек на диске)
+    "cover": 24 * 3600,
+}
+DEFAULT_MAX_STALE = 24 * 3600
+DEFAULT_MAX_ENTRIES = 5000
+# Сколько секунд воркер держит блокировку ключа и сколько другие ждут его результат
+DEFAULT_LOCK_TIMEOUT = 15
+
+_MISSING = object()
+
+
+class MetadataCache:
+    """Ключ записи — пара (вид данных, ключ); число записей ограничено `max_entries`."""
+
+    def __init__(self, ttls: Dict[str, float], max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_stale: float = DEFAULT_MAX_STALE, backend: Optional[Backend] = None,
+                 lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+                 fallback_on: Tuple[Type[BaseException], ...] = ()) -> None:
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self.backend = backend if backend is not None else MemoryBackend(max_entries)
+        self.lock_timeout = lock_timeout
+        self.fallback_on = fallback_on
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self.counters: Dict[str, Dict[str, int]] = {
+            kind: {"hits": 0, "stale_hits": 0, "misses": 0, "bypass": 0, "peer_waits": 0,
+                   "fallbacks": 0} for kind in ttls
+        }
+
+    async def get_or_load(self, kind: str, key: str, loader: Loader, bypass: bool = False,
+                          cacheable: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Значение из кэша или результат `loader()`.
+
+        `bypass` пропускает чтение из кэша (свежий результат всё равно сохраняется),
+        `cacheable` позволяет не сохранять неполные ответы, например с ошибками.
+        """
+        cache_key = (kind, key)
+        counters = self.counters[kind]
+
+        if bypass:
+            counters["bypass"] += 1
+            return await self._load(cache_key, loader, cacheable, coordinate=False)
+
+        entry = self.backend.get(cache_key)
+        now = time.time()
+        if entry is not None:
+            expires_at, value = entry
+            if now < expires_at:
+                counters["hits"] += 1
+                return value
+            if now < expires_at + self.max_stale:
+                counters["stale_hits"] += 1
+                self._refresh_in_background(cache_key, loader, cacheable)
+                return value
+
+        counters["misses"] += 1
+        task = self._inflight.get(cache_key) or self._start(cache_key, loader, cacheable)
+        return await asyncio.shield(task)
+
+    def peek(self, kind: str, key: str) -> Optional[Any]:
+        """Свежее значение без загрузки (None, если записи нет или TTL истёк)."""
+        entry = self.backend.get((kind, key))
+        if entry is None or time.time() >= entry[0]:
+            return None
+        self.counters[kind]["hits"] += 1
+        return entry[1]
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        """Сохраняет значение, собранное в обход `get_or_load` (например, потоковой выдачей)."""
+        self._store((kind, key), value)
+
+    def _store(self, cache_key: Tuple[str, str], value: Any) -> None:
+        self.backend.set(cache_key, time.time() + self.ttls[cache_key[0]], value)
+
+    async def _load(self, cache_key: Tuple[str, str], loader: Loader, cacheable: Callable[[Any], bool],
+                    coordinate: bool = True) -> Any:
+        locked = coordinate and self.backend.acquire(cache_key, self.lock_timeout)
+        if coordinate and not locked:
+            # Ключ загружает другой воркер — ждём его результат вместо второго запроса к Яндексу
+            self.counters[cache_key[0]]["peer_waits"] += 1
+            value = await self._wait_for_peer(cache_key)
+            if value is not _MISSING:
+                return value
+        try:
+            try:
+                value = await loader()
+            except self.fallback_on:
+                entry = self.backend.get(cache_key)
+                if entry is None:
+                    raise
+                self.counters[cache_key[0]]["fallbacks"] += 1
+                return entry[1]
+            if cacheable(value):
+                self._store(cache_key, value)
+            return value
+        finally:
+            if locked:
+                self.backend.release(cache_key)
+
+    async def _wait_for_peer(self, cache_key: Tuple[str, str]) -> Any:
+        """Свежая запись, сохранённая другим воркером; _MISSING, если он не справился за `lock_timeout`."""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(PEER_POLL_INTERVAL)
+            entry = self.backend.get(cache_key)
+            if entry is not None and time.time() < entry[0]:
+                return entry[1]
+            if not self.backend.is_locked(cache_key):
+                break
+        return _MISSING
+
+    def _start(self, cache_key: Tuple[str, str], loader: Loader, cacheable: Callable[[Any], bool]) -> asyncio.Task:
+        task = asyncio.create_task(self._load(cache_key, loader, cacheable))
+        self._inflight[cache_key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        return task
+
+    def _refresh_in_background(self, cache_key: Tuple[str, str], loader: Loader,
+                               cacheable: Callable[[Any], bool]) -> None:
+        if cache_key in self._inflight:
+            return
+        task = self._start(cache_key, loader, cacheable)
+        self._background.add(task)
+
+        def done(finished: asyncio.Task) -> None:
+            self._background.discard(finished)
+            if not finished.cancelled() and finished.exception() is not None:
+                print(f"Не удалось обновить кэш {cache_key}: {finished.exception()!r}")
+
+        task.add_done_callback(done)
+
+    def invalidate(self, kind: Optional[str] = None) -> None:
+        self.backend.delete(kind)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self.backend).__name__, "entries": self.backend.count(),
+                "max_entries": self.max_entries, "kinds": self.counters}
@@ -0,0 +1,276 @@
+"""Метрики задержек: маршруты, вызовы API Яндекса и этапы обработки внутри запроса.
+
+Гистограммы и счётчики отдаются в текстовом формате Prometheus (`render()`), а разбивка времени
+каждого запроса — в заголовке `Server-Timing` (видна во вкладке Network у браузера и в логах прокси).
+Вызовы Яндекса учитываются в `PooledRequest`, поэтому попадают в метрики все методы клиента.
+
+Метрики живут в памяти процесса: под gunicorn с несколькими воркерами у каждого воркера свои.
+"""
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from starlette.datastructures import MutableHeaders
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # профилировщик необязателен
+    Profiler = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UPSTREAM_CALLS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики по корзинам..., сумма, количество]
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labels, series in self._series.items():
+            for bound, count in zip(self.buckets, series):
+                le = _format_labels(self.labels, labels, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{le} {count}')
+            le = _format_labels(self.labels, labels, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {series[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {series[-1]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        lines.extend(f'{self.name}{_format_labels(self.labels, labels)} {value}'
+                     for labels, value in self._values.items())
+        return lines
+
+
+ROUTE_LATENCY = Histogram('http_request_duration_seconds', 'Время обработки запроса к сервису',
+                          ('method', 'route', 'status'))
+ROUTE_UPSTREAM_CALLS = Histogram('http_request_upstream_calls', 'Число вызовов API Яндекса на один запрос',
+                                 ('route',), buckets=UPSTREAM_CALLS_BUCKETS)
+UPSTREAM_LATENCY = Histogram('yandex_request_duration_seconds', 'Время вызова API Яндекса',
+                             ('method', 'endpoint'))
+UPSTREAM_ERRORS = Counter('yandex_request_errors_total', 'Ошибки вызовов API Яндекса', ('method', 'endpoint', 'error'))
+PHASE_LATENCY = Histogram('app_phase_duration_seconds', 'Время этапов обработки внутри сервиса', ('phase',))
+REJECTED_REQUESTS = Counter('http_rejected_requests_total', 'Запросы, отклонённые проверкой ключа и лимитами',
+                            ('reason',))
+UPSTREAM_RETRIES = Counter('yandex_request_retries_total', 'Повторы вызовов API Яндекса после сбоя', ('endpoint',))
+UPSTREAM_HEDGES = Counter('yandex_request_hedges_total', 'Дублирующие (хеджирующие) вызовы API Яндекса',
+                          ('endpoint',))
+UPSTREAM_REJECTIONS = Counter('yandex_request_rejections_total',
+                              'Вызовы API Яндекса, не отправленные из-за лимитов или открытого circuit breaker',
+                              ('endpoint', 'reason'))
+
+REGISTRY = (ROUTE_LATENCY, ROUTE_UPSTREAM_CALLS, UPSTREAM_LATENCY, UPSTREAM_ERRORS, PHASE_LATENCY, REJECTED_REQUESTS,
+            UPSTREAM_RETRIES, UPSTREAM_HEDGES, UPSTREAM_REJECTIONS)
+
+
+def render() -> str:
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+# id объектов ('123', '123:456'), размеры обложек ('200x200') и хэши в путях avatars/storage ('a1b2.a.123-1')
+_ID_SEGMENT_RE = re.compile(r'^(\d+(:\d+)?|\d+x\d+|(?=[\w.-]*\d)[\w-]+\.[\w.-]+)$')
+
+
+def endpoint_label(url: str) -> str:
+    """'https://api.music.yandex.net/users/1/playlists/3?x=1' -> '/users/{id}/playlists/{id}'.
+
+    Идентификаторы заменяются на {id}, чтобы у метрик и circuit breaker было конечное число меток.
+    """
+    segments = urlsplit(url).path.split('/')
+    return '/'.join('{id}' if _ID_SEGMENT_RE.match(segment) else segment for segment in segments)
+
+
+class RequestTimings:
+    """Время, потраченное одним запросом на вызовы Яндекса и этапы обработки (для Server-Timing)."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.upstream_calls = 0
+        # имя -> [суммарное время в секундах, число вызовов, описание]
+        self.entries: Dict[str, List[Any]] = {}
+
+    def add(self, name: str, seconds: float, description: str) -> None:
+        entry = self.entries.get(name)
+        if entry is None:
+            self.entries[name] = [seconds, 1, description]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def header(self) -> str:
+        parts = [f'{name};dur={total * 1000:.1f};desc="{_escape(description)} x{count}"'
+                 for name, (total, count, description) in self.entries.items()]
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(parts)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+
+
+def _timing_name(prefix: str, label: str) -> str:
+    return prefix + re.sub(r'[^0-9A-Za-z]+', '-', label).strip('-')
+
+
+def observe_upstream(method: str, url: str, seconds: float, error: Optional[BaseException] = None) -> None:
+    """Учитывает один вызов API Яндекса — в общих метриках и в разбивке текущего запроса."""
+    endpoint = endpoint_label(url)
+    UPSTREAM_LATENCY.observe((method, endpoint), seconds)
+    if error is not None:
+        UPSTREAM_ERRORS.inc((method, endpoint, type(error).__name__))
+
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.upstream_calls += 1
+        timings.add(_timing_name('yandex-', endpoint), seconds, f'{method} {endpoint}')
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Замеряет этап обработки (сериализация, проекция треков и т.п.)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        PHASE_LATENCY.observe((phase,), seconds)
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(_timing_name('app-', phase), seconds, phase)
+
+
+class SlowRequestProfiler:
+    """Профилирование медленных запросов через pyinstrument, включается и выключается на лету.
+
+    Профилируется доля `sample_rate` запросов и не больше одного запроса одновременно (pyinstrument
+    не умеет несколько профилировщиков в одном потоке). Профиль сохраняется в `directory`, только если
+    запрос занял дольше `threshold_ms`.
+    """
+
+    def __init__(self, directory: str, threshold_ms: float = 1000, sample_rate: float = 0.1,
+                 enabled: bool = False, keep: int = 50) -> None:
+        self.directory = directory
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self.keep = keep
+        self.saved: List[str] = []
+        self._active = False
+
+    @property
+    def available(self) -> bool:
+        return Profiler is not None
+
+    def start(self) -> Optional[Any]:
+        if not self.enabled or Profiler is None or self._active or random.random() >= self.sample_rate:
+            return None
+        profiler = Profiler(async_mode='enabled')
+        profiler.start()
+        self._active = True
+        return profiler
+
+    def finish(self, profiler: Any, name: str, seconds: float) -> None:
+        profiler.stop()
+        self._active = False
+        if seconds * 1000 < self.threshold_ms:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{_timing_name('', name)}-{seconds * 1000:.0f}ms.html"
+        with open(os.path.join(self.directory, filename), 'w', encoding='utf-8') as f:
+            f.write(profiler.output_html())
+        self.saved.append(filename)
+        while len(self.saved) > self.keep:
+            old = self.saved.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+
+    def status(self) -> Dict[str, Any]:
+        return {'available': self.available, 'enabled': self.enabled, 'threshold_ms': self.threshold_ms,
+                'sample_rate': self.sample_rate, 'directory': self.directory, 'profiles': self.saved}
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время запроса по шаблону маршрута, Server-Timing и профилирование медленных запросов."""
+
+    def __init__(self, app: Any, profiler: Optional[SlowRequestProfiler] = None) -> None:
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current_timings.set(timings)
+        profiler = self.profiler.start() if self.profiler is not None else None
+        status = 500
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                MutableHeaders(scope=message).append('Server-Timing', timings.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            seconds = time.perf_counter() - timings.started
+            # Шаблон пути ('/track/{track_id}'), а не сам путь — иначе по метке на каждый id
+            route = scope.get('route')
+            route_label = getattr(route, 'path', None) or 'unmatched'
+            ROUTE_LATENCY.observe((scope['method'], route_label, str(status)), seconds)
+            ROUTE_UPSTREAM_CALLS.observe((route_label,), timings.upstream_calls)
+            if profiler is not None:
+                self.profiler.finish(profiler, f"{scope['method']} {route_label}", seconds)
+            _current_timings.reset(token)
@@ -0,0 +1,146 @@
+"""Компактные представления объектов yandex_music для ответов API и быстрая JSON-сериализация.
+
+`to_dict()` выгружает весь граф объектов библиотеки (десятки полей, вложенные альбомы, артисты,
+права и т.д.) — для экранов приложения нужна малая часть. Здесь собраны схемы, которые отдают
+только нужные поля, и выбор колонок через `fields=`.
+"""
+from typing import Any, Dict, List, Optional
+
+import orjson
+from fastapi.responses import Response
+
+from metrics import timed
+
+COVER_SIZE = '200x200'
+
+TRACK_FIELDS = ('id', 'title', 'version', 'artists', 'artist_ids', 'album_id', 'album_title',
+                'duration_ms', 'cover_url', 'available', 'explicit')
+
+
+def cover_url(uri: Optional[str], size: str = COVER_SIZE) -> Optional[str]:
+    """Шаблон avatars.yandex.net/...%% -> https-ссылка на обложку нужного размера."""
+    return f"https://{uri.replace('%%', size)}" if uri else None
+
+
+def track_summary(track) -> Dict[str, Any]:
+    album = track.albums[0] if track.albums else None
+    return {
+        'id': str(track.id),
+        'title': track.title,
+        'version': track.version,
+        'artists': [artist.name for artist in track.artists or [] if artist.name],
+        'artist_ids': [artist.id for artist in track.artists or [] if artist.id is not None],
+        'album_id': album.id if album else None,
+        'album_title': album.title if album else None,
+        'duration_ms': track.duration_ms,
+        'cover_url': cover_url(track.cover_uri or (album.cover_uri if album else None)),
+        'available': track.available,
+        'explicit': track.content_warning == 'explicit',
+    }
+
+
+def artist_summary(artist) -> Dict[str, Any]:
+    return {
+        'id': artist.id,
+        'name': artist.name,
+        'cover_url': cover_url(artist.cover.uri if artist.cover else artist.og_image),
+    }
+
+
+def album_summary(album, with_tracks: bool = False) -> Dict[str, Any]:
+    summary = {
+        'id': album.id,
+        'title': album.title,
+        'version': album.version,
+        'year': album.year,
+        'genre': album.genre,
+        'artists': [artist.name for artist in album.artists or [] if artist.name],
+        'cover_url': cover_url(album.cover_uri),
+        'track_count': album.track_count,
+    }
+    if with_tracks:
+        summary['tracks'] = [track_summary(track) for volume in album.volumes or [] for track in volume]
+    return summary
+
+
+def playlist_summary(playlist) -> Dict[str, Any]:
+    return {
+        'owner_uid': playlist.owner.uid if playlist.owner else playlist.uid,
+        'kind': playlist.kind,
+        'title': playlist.title,
+        'cover_url': cover_url(playlist.cover.uri if playlist.cover else playlist.og_image),
+        'track_count': playlist.track_count,
+    }
+
+
+def user_summary(user) -> Dict[str, Any]:
+    return {
+        'uid': user.uid,
+        'login': user.login,
+        'name': user.display_name or user.name or user.login,
+        'verified': user.verified,
+    }
+
+
+# Подкасты в API — альбомы, выпуски подкастов — треки
+_SEARCH_SECTIONS = {
+    'tracks': track_summary,
+    'albums': album_summary,
+    'artists': artist_summary,
+    'playlists': playlist_summary,
+    'users': user_summary,
+    'podcasts': album_summary,
+    'podcast_episodes': track_summary,
+}
+
+_BEST_TYPES = {'track': track_summary, 'album': album_summary, 'artist': artist_summary,
+               'playlist': playlist_summary, 'user': user_summary, 'podcast': album_summary,
+               'podcast_episode': track_summary}
+
+
+def best_summary(best) -> Optional[Dict[str, Any]]:
+    if best is None or best.result is None or best.type not in _BEST_TYPES:
+        return None
+    return {'type': best.type, 'result': _BEST_TYPES[best.type](best.result)}
+
+
+def search_summary(search) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {'text': search.text, 'page': search.page, 'best': best_summary(search.best)}
+
+    for section, project in _SEARCH_SECTIONS.items():
+        result = getattr(search, section)
+        summary[section] = {
+            'total': result.total if result else 0,
+            'results': [project(item) for item in result.results or []] if result else [],
+        }
+    return summary
+
+
+def suggest_summary(suggestions) -> Dict[str, Any]:
+    if suggestions is None:
+        return {'best': None, 'suggestions': []}
+    return {'best': best_summary(suggestions.best), 'suggestions': list(suggestions.suggestions or [])}
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def select_fields(summaries: List[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Оставляет в каждой краткой записи только поля из `fields` (порядок — как в `fields`)."""
+    if not fields:
+        return summaries
+    return [{field: summary[field] for field in fields if field in summary} for summary in summaries]
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_response(value: Any, **kwargs: Any) -> Response:
+    """JSON-ответ через orjson в обход jsonable_encoder FastAPI — ответ уже состоит из dict/list/str."""
+    with timed('serialize'):
+        content = dumps(value)
+    return Response(content=content, media_type='application/json', **kwargs)
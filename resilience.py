@@ -0,0 +1,240 @@
+"""Защита сервиса от проблем API Яндекса: лимит одновременных вызовов, повторы, circuit breaker, хеджирование.
+
+`UpstreamGovernor` оборачивает каждый вызов API в `PooledRequest`:
+
+* общий и поэндпоинтный семафоры — при медленном Яндексе вызовы не копятся бесконечно, а после
+  `queue_timeout` ожидания слота падают с `UpstreamBusyError`;
+* повторы с экспоненциальной задержкой и полным джиттером — только для читающих запросов;
+* circuit breaker на каждый эндпоинт — после `failure_threshold` сбоев подряд вызовы `reset_timeout`
+  секунд сразу падают с `CircuitOpenError`, затем один пробный вызов решает, закрыть ли его;
+* хеджирование — если читающий запрос не ответил за `hedge_delay`, параллельно уходит второй,
+  берётся первый успешный ответ. Второй запрос занимает свои слоты семафоров; если свободных
+  нет, он не отправляется, так что лимиты не превышаются.
+
+Обе ошибки наследуют NetworkError, поэтому для кэша и обработчиков они выглядят как сбой сети.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from yandex_music.exceptions import NetworkError, YandexMusicError
+
+from metrics import UPSTREAM_HEDGES, UPSTREAM_REJECTIONS, UPSTREAM_RETRIES, endpoint_label
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_MAX_CONCURRENCY_PER_ENDPOINT = 16
+DEFAULT_QUEUE_TIMEOUT = 2.0
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_BASE = 0.1
+DEFAULT_BACKOFF_MAX = 1.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+# POST-методы API, которые только читают данные (списки id в теле запроса) — их можно повторять
+IDEMPOTENT_POSTS = frozenset({'/tracks', '/albums', '/artists', '/playlists/list'})
+
+
+class UpstreamBusyError(NetworkError):
+    """Слишком много одновременных вызовов API: слот не освободился за `queue_timeout`."""
+
+
+class CircuitOpenError(NetworkError):
+    """Эндпоинт API временно отключён после серии сбоев."""
+
+    def __init__(self, endpoint: str, retry_after: float) -> None:
+        super().__init__(f"API Яндекса недоступно ({endpoint}), повтор через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """closed -> (failure_threshold сбоев подряд) -> open -> (reset_timeout) -> half-open -> closed/open."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def before_call(self, endpoint: str) -> bool:
+        """Пропускает вызов или бросает CircuitOpenError; True — вызов пробный, его исход надо записать."""
+        state = self.state
+        if state == 'closed':
+            return False
+        if state == 'half-open' and not self._probing:
+            # Пропускаем один пробный вызов, остальные продолжают падать сразу
+            self._probing = True
+            return True
+        retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(endpoint, retry_after)
+
+    def release_probe(self) -> None:
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+
+class UpstreamGovernor:
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_concurrency_per_endpoint: int = DEFAULT_MAX_CONCURRENCY_PER_ENDPOINT,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 backoff_base: float = DEFAULT_BACKOFF_BASE, backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 hedge_delay: Optional[float] = None) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_endpoint = max_concurrency_per_endpoint
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_delay = hedge_delay
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._endpoints: Dict[str, asyncio.Semaphore] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def _semaphore(self, endpoint: str) -> asyncio.Semaphore:
+        semaphore = self._endpoints.get(endpoint)
+        if semaphore is None:
+            semaphore = self._endpoints[endpoint] = asyncio.Semaphore(self.max_concurrency_per_endpoint)
+        return semaphore
+
+    @staticmethod
+    def is_idempotent(method: str, endpoint: str) -> bool:
+        return method == 'GET' or (method == 'POST' and endpoint in IDEMPOTENT_POSTS)
+
+    async def call(self, method: str, url: str, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполняет `send()` — одну попытку запроса — с лимитами, повторами, breaker и хеджированием."""
+        endpoint = endpoint_label(url)
+        breaker = self.breaker(endpoint)
+        try:
+            probe = breaker.before_call(endpoint)
+        except CircuitOpenError:
+            UPSTREAM_REJECTIONS.inc((endpoint, 'circuit'))
+            raise
+
+        idempotent = self.is_idempotent(method, endpoint)
+        try:
+            async with self._slot(self._global, endpoint, 'global'), \
+                    self._slot(self._semaphore(endpoint), endpoint, 'endpoint'):
+                attempt = 0
+                while True:
+                    try:
+                        if idempotent and self.hedge_delay is not None:
+                            result = await self._hedged(endpoint, send)
+                        else:
+                            result = await send()
+                    except NetworkError:
+                        breaker.record_failure()
+                        if not idempotent or attempt >= self.retries or breaker.state != 'closed':
+                            raise
+                        attempt += 1
+                        UPSTREAM_RETRIES.inc((endpoint,))
+                        await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+                        continue
+                    except YandexMusicError:
+                        # 400/401/404 — Яндекс ответил, значит он жив
+                        breaker.record_success()
+                        raise
+                    breaker.record_success()
+                    return result
+        except BaseException:
+            # Слот не дождались или вызов отменили (wait_for, отключение клиента, проигравший хедж):
+            # исход пробного вызова неизвестен, пробу отдаём следующему запросу
+            if probe:
+                breaker.release_probe()
+            raise
+
+    def _slot(self, semaphore: asyncio.Semaphore, endpoint: str, scope: str) -> '_Slot':
+        return _Slot(semaphore, self.queue_timeout, endpoint, scope)
+
+    async def _hedged(self, endpoint: str, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Первая попытка, а если она не ответила за `hedge_delay` — вторая параллельно; кто первый успешен.
+
+        Вторая попытка занимает свои слоты общего и поэндпоинтного семафоров и освобождает их, когда
+        завершится; если свободных слотов нет, она не отправляется.
+        """
+        tasks = [asyncio.ensure_future(send())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            semaphores = (self._global, self._semaphore(endpoint))
+            if not done and not any(semaphore.locked() for semaphore in semaphores):
+                # Семафоры не заняты, acquire вернётся сразу, без переключения задач
+                for semaphore in semaphores:
+                    await semaphore.acquire()
+                UPSTREAM_HEDGES.inc((endpoint,))
+
+                def release(_: asyncio.Future) -> None:
+                    for semaphore in semaphores:
+                        semaphore.release()
+
+                hedge = asyncio.ensure_future(send())
+                hedge.add_done_callback(release)
+                tasks.append(hedge)
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'available': self._global._value,
+            'endpoints': {
+                endpoint: {'state': breaker.state, 'failures': breaker.failures,
+                           'available': self._semaphore(endpoint)._value}
+                for endpoint, breaker in self._breakers.items()
+            },
+        }
+
+
+class _Slot:
+    """Слот семафора с ограниченным ожиданием: не дождались за `timeout` — UpstreamBusyError."""
+
+    def __init__(self, semaphore: asyncio.Semaphore, timeout: float, endpoint: str, scope: str) -> None:
+        self.semaphore = semaphore
+        self.timeout = timeout
+        self.endpoint = endpoint
+        self.scope = scope
+
+    async def __aenter__(self) -> None:
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            UPSTREAM_REJECTIONS.inc((self.endpoint, self.scope))
+            raise UpstreamBusyError(f"Слишком много одновременных запросов к API Яндекса ({self.endpoint})") from None
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.semaphore.release()
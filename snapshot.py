@@ -0,0 +1,133 @@
+"""Заранее собранный и сериализованный ответ, который фоновая задача пересобирает по расписанию.
+
+Запрос к эндпоинту со снапшотом — это чтение готовых байтов из памяти: сборка, походы в Яндекс
+и сериализация происходят в фоне, а новая версия подменяет старую одним присваиванием.
+"""
+import asyncio
+import hashlib
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from cache_backends import PEER_POLL_INTERVAL, Backend
+from projections import dumps
+
+SnapshotState = Tuple[bytes, str, float]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (список ETag через запятую, слабые W/ или *)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+class Snapshot:
+    """Хранит последнюю удачную сборку `build()` вместе с ETag.
+
+    Неполный результат (`is_complete` вернул False) не заменяет уже собранный снапшот — клиенты
+    продолжают получать предыдущую версию до следующей удачной сборки.
+
+    С общим хранилищем (`backend.shared`) собирает снапшот один воркер: он публикует байты под
+    ключом ('snapshot', name), остальные подхватывают их вместо своей сборки.
+    """
+
+    def __init__(self, build: Callable[[], Awaitable[Any]], interval: float,
+                 is_complete: Callable[[Any], bool] = lambda value: True, name: str = 'default',
+                 backend: Optional[Backend] = None) -> None:
+        self.build = build
+        self.interval = interval
+        self.is_complete = is_complete
+        self.name = name
+        self.backend = backend if backend is not None and backend.shared else None
+        self._state: Optional[SnapshotState] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def _key(self) -> Tuple[str, str]:
+        return 'snapshot', self.name
+
+    @staticmethod
+    def serialize(value: Any) -> bytes:
+        return dumps(value)
+
+    def _store(self, value: Any) -> bool:
+        if not self.is_complete(value):
+            return False
+        body = self.serialize(value)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self._state = (body, etag, time.time())
+        if self.backend is not None:
+            self.backend.set(self._key, time.time() + self.interval, {'body': body.decode(), 'etag': etag})
+        return True
+
+    def _adopt(self) -> bool:
+        """Берёт свежий снапшот, опубликованный другим воркером."""
+        if self.backend is None:
+            return False
+        entry = self.backend.get(self._key)
+        if entry is None or entry[0] <= time.time():
+            return False
+        published = entry[1]
+        if self._state is None or self._state[1] != published['etag']:
+            self._state = (published['body'].encode(), published['etag'], time.time())
+        return True
+
+    async def _wait_for_peer(self) -> bool:
+        """Ждёт снапшот, который прямо сейчас собирает другой воркер (не дольше `interval`)."""
+        deadline = time.monotonic() + self.interval
+        while not self._adopt():
+            if self.backend is None or not self.backend.is_locked(self._key) or time.monotonic() > deadline:
+                return False
+            await asyncio.sleep(PEER_POLL_INTERVAL)
+        return True
+
+    async def get(self) -> Tuple[bytes, Optional[str]]:
+        """Тело ответа и ETag; до первой удачной сборки собирает синхронно (ETag тогда None)."""
+        state = self._state
+        if state is None:
+            async with self._lock:
+                if self._state is None and not await self._wait_for_peer():
+                    value = await self.build()
+                    if not self._store(value):
+                        return self.serialize(value), None
+            state = self._state
+        return state[0], state[1]
+
+    async def refresh(self, force: bool = False) -> None:
+        """Пересобирает снапшот; без `force` сначала смотрит, не собрал ли его уже другой воркер."""
+        async with self._lock:
+            if not force and self._adopt():
+                return
+            if not force and self.backend is not None and not self.backend.acquire(self._key, self.interval):
+                return  # собирает другой воркер, подхватим его результат на следующем шаге
+            try:
+                value = await self.build()
+                if not self._store(value):
+                    print(f"Снапшот не обновлён, сборка неполная: {str(value)[:200]}")
+            finally:
+                if not force and self.backend is not None:
+                    self.backend.release(self._key)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Ошибка фонового обновления снапшота: {e!r}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Запускает фоновую пересборку: первая сразу, дальше раз в `interval` секунд."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
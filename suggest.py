@@ -0,0 +1,190 @@
+"""Подсказки поиска при наборе текста: кэш по префиксам, склейка одинаковых запросов и отмена устаревших нажатий.
+
+Приложение запрашивает подсказки на каждое нажатие клавиши. Чтобы это не превращалось в запрос
+к Яндексу на каждую букву:
+
+* ответ хранится по нормализованному префиксу; если у более короткого префикса список подсказок
+  полный (короче `max_results` — Яндекс отдал всё, что нашёл), ответ на длинный префикс получается
+  фильтрацией этого списка без похода в Яндекс;
+* одинаковые префиксы, запрошенные одновременно, загружаются один раз, а запрос, для которого уже
+  загружается более короткий префикс, сначала ждёт его;
+* запросы с одним `session` (сеанс набора в приложении) выдерживают паузу `debounce`: если за неё
+  пришло следующее нажатие, предыдущее в Яндекс не уходит, а его ожидание сразу прерывается.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+Suggest = Dict[str, Any]
+Loader = Callable[[str], Awaitable[Suggest]]
+
+DEFAULT_TTL = 10 * 60
+DEFAULT_MAX_ENTRIES = 10000
+# Столько подсказок максимум отдаёт Яндекс; более короткий список считается полным
+DEFAULT_MAX_RESULTS = 10
+DEFAULT_DEBOUNCE = 0.1
+
+
+class Superseded(Exception):
+    """Пока запрос ждал, в том же сеансе набора пришёл более новый."""
+
+
+def normalize(part: str) -> str:
+    return ' '.join(part.lower().split())
+
+
+def matches(suggestion: str, part: str) -> bool:
+    """Подсказка подходит к префиксу, если с него начинается она сама или одно из её слов."""
+    text = normalize(suggestion)
+    return text.startswith(part) or f' {part}' in text
+
+
+class SuggestCache:
+    """Подсказки по префиксам в памяти процесса, не больше `max_entries` записей (LRU)."""
+
+    def __init__(self, load: Loader, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_results: int = DEFAULT_MAX_RESULTS, debounce: float = DEFAULT_DEBOUNCE) -> None:
+        self.load = load
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_results = max_results
+        self.debounce = debounce
+        self._entries: "OrderedDict[str, Tuple[float, Suggest]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._sessions: Dict[str, asyncio.Event] = {}
+        self.counters = {"hits": 0, "prefix_hits": 0, "joined": 0, "misses": 0, "superseded": 0}
+
+    async def suggest(self, part: str, session: Optional[str] = None) -> Suggest:
+        """Подсказки для `part`; Superseded, если в сеансе `session` пришёл более новый запрос."""
+        part = normalize(part)
+        if not part:
+            return {'best': None, 'suggestions': []}
+        superseded = self._enter(session) if session else None
+        try:
+            result = self.lookup(part)
+            if result is not None:
+                return result
+
+            if superseded is not None and self.debounce:
+                try:
+                    await asyncio.wait_for(superseded.wait(), timeout=self.debounce)
+                except asyncio.TimeoutError:
+                    pass
+                else:
+                    self.counters["superseded"] += 1
+                    raise Superseded
+                # За время паузы мог загрузиться более короткий префикс
+                result = self.lookup(part)
+                if result is not None:
+                    return result
+
+            parent = self._inflight_prefix(part)
+            if parent is not None:
+                self.counters["joined"] += 1
+                try:
+                    await self._wait(parent, superseded)
+                except Superseded:
+                    raise
+                except Exception:
+                    pass  # короткий префикс не загрузился — загружаем свой
+                result = self.lookup(part)
+                if result is not None:
+                    return result
+
+            task = self._inflight.get(part)
+            if task is None:
+                self.counters["misses"] += 1
+                task = self._start(part)
+            else:
+                self.counters["joined"] += 1
+            return await self._wait(task, superseded)
+        finally:
+            if session and self._sessions.get(session) is superseded:
+                del self._sessions[session]
+
+    def lookup(self, part: str) -> Optional[Suggest]:
+        """Ответ без похода в Яндекс: свой префикс или более короткий с полным списком подсказок."""
+        now = time.monotonic()
+        result = self._get(part, now)
+        if result is not None:
+            self.counters["hits"] += 1
+            return result
+        for end in range(len(part) - 1, 0, -1):
+            parent = self._get(part[:end], now)
+            if parent is not None and len(parent['suggestions']) < self.max_results:
+                self.counters["prefix_hits"] += 1
+                return self._narrow(parent, part)
+        return None
+
+    @staticmethod
+    def _narrow(parent: Suggest, part: str) -> Suggest:
+        suggestions = [suggestion for suggestion in parent['suggestions'] if matches(suggestion, part)]
+        # Лучший результат относится к первой подсказке: оставляем его, только если она не отфильтрована
+        keep_best = bool(suggestions) and suggestions[0] == parent['suggestions'][0]
+        return {'best': parent['best'] if keep_best else None, 'suggestions': suggestions}
+
+    def _get(self, part: str, now: float) -> Optional[Suggest]:
+        entry = self._entries.get(part)
+        if entry is None:
+            return None
+        if now >= entry[0]:
+            del self._entries[part]
+            return None
+        self._entries.move_to_end(part)
+        return entry[1]
+
+    def _store(self, part: str, result: Suggest) -> None:
+        self._entries[part] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(part)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _enter(self, session: str) -> asyncio.Event:
+        previous = self._sessions.get(session)
+        if previous is not None:
+            previous.set()
+        event = self._sessions[session] = asyncio.Event()
+        return event
+
+    def _inflight_prefix(self, part: str) -> Optional[asyncio.Task]:
+        for end in range(len(part) - 1, 0, -1):
+            task = self._inflight.get(part[:end])
+            if task is not None:
+                return task
+        return None
+
+    async def _wait(self, task: asyncio.Task, superseded: Optional[asyncio.Event]) -> Suggest:
+        """Ждёт загрузку, но не дольше, чем до следующего нажатия; сама загрузка не отменяется —
+        её результат пригодится следующим префиксам."""
+        if superseded is None:
+            return await asyncio.shield(task)
+        waiter = asyncio.ensure_future(superseded.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if not task.done():
+            self.counters["superseded"] += 1
+            raise Superseded
+        return task.result()
+
+    def _start(self, part: str) -> asyncio.Task:
+        task = asyncio.create_task(self._fetch(part))
+        self._inflight[part] = task
+
+        def done(finished: asyncio.Task) -> None:
+            self._inflight.pop(part, None)
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(done)
+        return task
+
+    async def _fetch(self, part: str) -> Suggest:
+        result = await self.load(part)
+        self._store(part, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "max_entries": self.max_entries, **self.counters}
@@ -15,10 +15,10 @@ app = FastAPI()
 # 3. YANDEX_TOKEN и API_KEY (если используется middleware для X-API-KEY)
 
 def get_client():
-    token = "y0__xCu8NrtARje-AYg0Zu9hhNfQEdS_DMm_uaUVeUOhb-WPf-a_A"
+    token = os.getenv("YANDEX_TOKEN")
     if not token:
         raise RuntimeError("YANDEX_TOKEN не найден в переменных окружения.")
-    return Client(token).init()
+    return Client(token, base_url=os.getenv("YANDEX_BASE_URL")).init()
 
 # --- Pydantic модели для структурированного ответа ---
 def get_user_mixes_final():
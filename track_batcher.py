@@ -0,0 +1,83 @@
+"""Склейка одиночных запросов треков в пакетные вызовы `client.tracks()` (в духе dataloader).
+
+Экраны приложения грузят списки, и клиент параллельно шлёт десятки `/track/{id}`. Запросы,
+пришедшие в течение `window` секунд, уходят в Яндекс одним вызовом `tracks()` со списком id,
+результат раскладывается обратно по ожидающим.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set
+
+from yandex_music import Track
+from yandex_music.exceptions import NotFoundError
+
+LoadMany = Callable[[Sequence[str]], Awaitable[List[Track]]]
+
+DEFAULT_WINDOW = 0.005
+DEFAULT_MAX_BATCH = 100
+
+
+def base_track_id(track_id: str) -> str:
+    """'123:456' (трек:альбом) -> '123': в ответе tracks() id трека без альбома."""
+    return str(track_id).split(':', 1)[0]
+
+
+class TrackBatcher:
+    """Копит запрошенные id и раз в `window` секунд (или при `max_batch` id) отправляет их одним вызовом."""
+
+    def __init__(self, load_many: LoadMany, window: float = DEFAULT_WINDOW,
+                 max_batch: int = DEFAULT_MAX_BATCH) -> None:
+        self.load_many = load_many
+        self.window = window
+        self.max_batch = max_batch
+        self.batches_sent = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Ссылки на отправленные пакеты: задачу без ссылок сборщик мусора может удалить на полпути
+        self._dispatching: Set[asyncio.Task] = set()
+
+    async def load(self, track_id: str) -> Track:
+        """Трек по id; одинаковые id в одном окне запрашиваются один раз."""
+        track_id = str(track_id)
+        future = self._pending.get(track_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[track_id] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            self.batches_sent += 1
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: Dict[str, asyncio.Future]) -> None:
+        try:
+            tracks = await self.load_many(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+                    # Все ожидающие могли уже отмениться — не оставляем «never retrieved»
+                    future.exception()
+            return
+
+        by_id = {str(track.id): track for track in tracks if track is not None}
+        for track_id, future in batch.items():
+            if future.done():
+                continue
+            track = by_id.get(base_track_id(track_id))
+            if track is not None:
+                future.set_result(track)
+            else:
+                future.set_exception(NotFoundError(f"Трек {track_id} не найден"))
+                future.exception()
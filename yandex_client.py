@@ -0,0 +1,131 @@
+"""Общий на весь процесс асинхронный клиент Яндекс Музыки.
+
+Клиент создаётся один раз (лениво или при старте приложения) и переиспользуется всеми запросами:
+aiohttp-сессия с keep-alive держит открытые соединения к api.music.yandex.net, а `account_status`
+вызывается только при инициализации, а не перед каждым запросом.
+"""
+import asyncio
+import time
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+import aiohttp
+from yandex_music import ClientAsync
+from yandex_music.exceptions import NetworkError, TimedOutError, UnauthorizedError
+from yandex_music.utils.request_async import Request
+from yandex_music.utils.schema_mismatch import set_current_endpoint
+
+from metrics import observe_upstream
+from resilience import UpstreamGovernor
+
+T = TypeVar("T")
+
+DEFAULT_POOL_SIZE = 20
+
+
+class PooledRequest(Request):
+    """Request из yandex_music, который ходит через одну `aiohttp.ClientSession` с пулом соединений.
+
+    Стандартный Request вызывает `aiohttp.request`, то есть открывает новую сессию и новое TCP/TLS
+    соединение на каждый вызов API. Каждый вызов проходит через `governor` (лимиты, повторы, circuit breaker).
+    Опирается на внутренние методы Request, поэтому версия yandex-music зафиксирована в requirements.txt.
+    """
+
+    def __init__(self, *args: Any, pool_size: int = DEFAULT_POOL_SIZE,
+                 governor: Optional[UpstreamGovernor] = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.pool_size = pool_size
+        self.governor = governor
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Сессию можно создать только внутри работающего event loop, поэтому лениво
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self._session
+
+    async def _request_wrapper(self, *args: Any, **kwargs: Any) -> bytes:
+        method, url = args[:2]
+        set_current_endpoint(method, url)
+        kwargs = self._prepare_kwargs(kwargs)
+        if self.governor is None:
+            return await self._send(*args, **kwargs)
+        return await self.governor.call(method, url, lambda: self._send(*args, **kwargs))
+
+    async def _send(self, *args: Any, **kwargs: Any) -> bytes:
+        """Одна попытка запроса; повторы и хеджирование делает `governor`."""
+        method, url = args[:2]
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            try:
+                async with self.session.request(*args, **kwargs) as resp:
+                    content = await resp.read()
+            except asyncio.TimeoutError as e:
+                raise TimedOutError from e
+            except aiohttp.ClientError as e:
+                raise NetworkError(e) from e
+
+            if not HTTPStatus.OK <= resp.status < HTTPStatus.MULTIPLE_CHOICES:
+                self._handle_error_response(resp.status, content)
+        except BaseException as e:
+            # CancelledError тоже учитываем: так видны вызовы, оборванные по wait_for
+            error = e
+            raise
+        finally:
+            observe_upstream(method, url, time.perf_counter() - started, error)
+
+        return content
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class ClientManager:
+    """Жизненный цикл общего клиента: ленивая инициализация, повторная проверка при ошибке авторизации, закрытие."""
+
+    def __init__(self, token: Optional[str], base_url: Optional[str] = None,
+                 pool_size: int = DEFAULT_POOL_SIZE, governor: Optional[UpstreamGovernor] = None) -> None:
+        self.token = token
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.governor = governor
+        self._client: Optional[ClientAsync] = None
+        self._lock = asyncio.Lock()
+
+    async def get(self) -> ClientAsync:
+        """Возвращает инициализированный клиент, создавая его при первом обращении."""
+        client = self._client
+        if client is not None:
+            return client
+
+        async with self._lock:
+            if self._client is None:
+                request = PooledRequest(pool_size=self.pool_size, governor=self.governor)
+                try:
+                    self._client = await ClientAsync(self.token, base_url=self.base_url, request=request).init()
+                except Exception:
+                    await request.close()
+                    raise
+            return self._client
+
+    async def invalidate(self) -> None:
+        """Сбрасывает клиент: следующий `get()` заново проверит токен через `init()`."""
+        async with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            await client.request.close()
+
+    async def call(self, func: Callable[[ClientAsync], Awaitable[T]]) -> T:
+        """Выполняет `await func(client)`; при ошибке авторизации пересоздаёт клиент и пробует ещё раз."""
+        try:
+            return await func(await self.get())
+        except UnauthorizedError:
+            await self.invalidate()
+            return await func(await self.get())
+
+    async def close(self) -> None:
+        await self.invalidate()